@@ -0,0 +1,415 @@
+#!/usr/bin/env python
+
+"""
+benchmarks for the steps tooling
+
+all the benchmarks run on synthetic steps repos,
+that are built locally - and quickly - with git fast-import
+
+the pipeline benchmark times each phase - tofolders, togit, chain-dirs and
+fillauto - and can save its results in JSON, to compare them across commits
+"""
+
+import os
+import io
+import sys
+import json
+import random
+import time
+import platform
+import tempfile
+import contextlib
+import subprocess as sp
+from pathlib import Path
+from datetime import datetime
+
+import logging
+logger = logging.getLogger('steps')
+
+(debug, info, warning, error) = logger.debug, logger.info, logger.warning, logger.error
+
+import click
+
+import steps
+import stepstohike
+import fillauto
+from diffengines import DIFF_ENGINES
+
+
+# the extensions of the synthetic files, and how to write a line in each
+SYNTHETIC_KINDS = [
+    ('py', lambda n: f"value_{n} = compute({n})  # some python"),
+    ('html', lambda n: f"<div class='item'>item {n}</div>"),
+    ('css', lambda n: f".item-{n} {{ color: #{n % 4096:03x}; }}"),
+    ('js', lambda n: f"const item{n} = document.getElementById('item-{n}')"),
+]
+
+
+def synthetic_path(index):
+    extension, _ = SYNTHETIC_KINDS[index % len(SYNTHETIC_KINDS)]
+    folder = {'py': '', 'html': 'templates/', 'css': 'static/', 'js': 'static/'}[extension]
+    return f"{folder}file{index:03d}.{extension}"
+
+
+def synthetic_line(index, n):
+    _, maker = SYNTHETIC_KINDS[index % len(SYNTHETIC_KINDS)]
+    return maker(n)
+
+
+def synthetic_repo(repo: Path, *, nb_steps=300, nb_files=20, nb_lines=100,
+                   churn=0.1, seed=0) -> Path:
+    """
+    create a git repo with one commit per step, with a subject that
+    follows the 'step <n> - <message>' convention
+
+    - nb_files files of about nb_lines lines each are created in the first step
+    - at each following step, a fraction churn of the files gets modified,
+      and each modified file comes with a <file>-step.md
+    """
+    rng = random.Random(seed)
+    sp.run(['git', 'init', '-q', '--initial-branch=main', str(repo)], check=True)
+    contents = {
+        synthetic_path(index): [synthetic_line(index, n) for n in range(nb_lines)]
+        for index in range(nb_files)
+    }
+    stream = []
+
+    def data(payload: bytes):
+        stream.append(f"data {len(payload)}\n".encode())
+        stream.append(payload)
+        stream.append(b"\n")
+
+    def modify(path, text):
+        stream.append(f"M 100644 inline {path}\n".encode())
+        data(text.encode())
+
+    step_mds = []
+    for step in range(nb_steps):
+        stream.append(b"commit refs/heads/main\n")
+        stream.append(f"committer Bench <bench@example.com> {1_700_000_000 + step} +0000\n".encode())
+        data(f"step {step:03d} - synthetic step {step}".encode())
+        for path in step_mds:
+            stream.append(f"D {path}-step.md\n".encode())
+        if step == 0:
+            changed = list(contents)
+        else:
+            nb_changed = max(1, round(churn * nb_files))
+            changed = rng.sample(list(contents), nb_changed)
+            for path in changed:
+                index = int(Path(path).stem[4:])
+                lines = contents[path]
+                for _ in range(rng.randint(1, 5)):
+                    position = rng.randrange(len(lines) + 1)
+                    lines.insert(position, synthetic_line(index, rng.randrange(100_000)))
+                if len(lines) > nb_lines and rng.random() < 0.5:
+                    del lines[rng.randrange(len(lines))]
+        for path in changed:
+            modify(path, "\n".join(contents[path]) + "\n")
+            modify(f"{path}-step.md", f"## changes in {path} at step {step}\n\nsome words\n")
+        step_mds = changed
+        stream.append(b"\n")
+    sp.run(['git', '-C', str(repo), 'fast-import', '--quiet'],
+           input=b"".join(stream), check=True)
+    sp.run(['git', '-C', str(repo), 'reset', '-q', '--hard'], check=True)
+    return repo
+
+
+def git_identity():
+    """
+    togit needs an identity to create commits
+    """
+    for variable in ('GIT_AUTHOR_NAME', 'GIT_COMMITTER_NAME'):
+        os.environ.setdefault(variable, "Bench")
+    for variable in ('GIT_AUTHOR_EMAIL', 'GIT_COMMITTER_EMAIL'):
+        os.environ.setdefault(variable, "bench@example.com")
+
+
+def timed(function, *args, **kwds):
+    """
+    returns the time taken by the call, and its result
+    """
+    start = time.perf_counter()
+    result = function(*args, **kwds)
+    return time.perf_counter() - start, result
+
+
+def same_trees(folder1: Path, folder2: Path) -> bool:
+    # the manifest is only written in batch mode
+    return sp.run(['diff', '-rq', '-x', steps.MANIFEST, str(folder1), str(folder2)],
+                  stdout=sp.DEVNULL).returncode == 0
+
+
+def report(title, results):
+    """
+    results is a list of (label, seconds); the first one is the reference
+    """
+    print(f"===== {title}")
+    reference = results[0][1]
+    for label, seconds in results:
+        print(f"{label:>20}: {seconds:8.3f}s   x{reference / seconds:6.2f}")
+
+
+@click.group(chain=True, help=sys.modules[__name__].__doc__)
+@click.option("--debug", is_flag=True, help="enable debug output")
+def cli(debug):
+    # steps.py configures logging at import time
+    logging.getLogger().setLevel(logging.DEBUG if debug else logging.WARNING)
+
+
+@cli.command('tofolders', help="compare the legacy and batch paths in steps.py tofolders")
+@click.option('-s', '--steps', 'nb_steps', type=int, default=300, help="number of steps")
+@click.option('-f', '--files', 'nb_files', type=int, default=20, help="number of files")
+@click.option('-l', '--lines', 'nb_lines', type=int, default=100, help="number of lines per file")
+@click.option('-c', '--churn', type=float, default=0.1, help="fraction of the files changed in each step")
+def tofolders_bench(nb_steps, nb_files, nb_lines, churn):
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        repo = synthetic_repo(tmp / "repo", nb_steps=nb_steps, nb_files=nb_files,
+                              nb_lines=nb_lines, churn=churn)
+        legacy, _ = timed(steps.tofolders, repo, tmp / "legacy", batch=False)
+        batch, _ = timed(steps.tofolders, repo, tmp / "batch", batch=True)
+        if not same_trees(tmp / "legacy", tmp / "batch"):
+            error("the legacy and batch outputs differ")
+            # click ignores the return value
+            sys.exit(1)
+        report(f"tofolders - {nb_steps} steps x {nb_files} files",
+               [("legacy", legacy), ("batch", batch)])
+    return 0
+
+
+def branch_log(repo: Path, branch: str) -> str:
+    return sp.run(['git', '-C', str(repo), 'log', '--format=%T %s', branch],
+                  capture_output=True, check=True).stdout.decode()
+
+
+@cli.command('togit', help="compare the legacy and fast-import paths in steps.py togit")
+@click.option('-s', '--steps', 'nb_steps', type=int, default=100, help="number of steps")
+@click.option('-f', '--files', 'nb_files', type=int, default=20, help="number of files")
+@click.option('-l', '--lines', 'nb_lines', type=int, default=100, help="number of lines per file")
+@click.option('-c', '--churn', type=float, default=0.1, help="fraction of the files changed in each step")
+def togit_bench(nb_steps, nb_files, nb_lines, churn):
+    git_identity()
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        repo = synthetic_repo(tmp / "repo", nb_steps=nb_steps, nb_files=nb_files,
+                              nb_lines=nb_lines, churn=churn)
+        steps.tofolders(repo, tmp / "steps")
+        # the legacy path changes directory
+        cwd = Path.cwd()
+        legacy, _ = timed(steps.togit, tmp / "legacy",
+                          input_steps_folder=tmp / "steps", fast_import=False)
+        os.chdir(cwd)
+        fast, _ = timed(steps.togit, tmp / "fast",
+                        input_steps_folder=tmp / "steps", fast_import=True)
+        if branch_log(tmp / "legacy", "steps") != branch_log(tmp / "fast", "steps"):
+            error("the legacy and fast-import branches differ")
+            sys.exit(1)
+        report(f"togit - {nb_steps} steps x {nb_files} files",
+               [("legacy", legacy), ("fast-import", fast)])
+    return 0
+
+
+def synthetic_pair(nb_lines, nb_edits, seed=0):
+    """
+    a pair of long files with many repeated lines - like generated html
+    templates or big css files - and a few scattered edits in the second one
+    """
+    rng = random.Random(seed)
+    patterns = ["<div class='row'>", "  <div class='cell'>", "    {{ item }}",
+                "  </div>", "</div>", "", "}", "  margin: 0;", "  padding: 0;"]
+    lines1 = []
+    for n in range(nb_lines):
+        # mostly repeated lines, with a few unique ones
+        if n % 25 == 0:
+            lines1.append(f"<!-- section {n} -->")
+        else:
+            lines1.append(rng.choice(patterns))
+    lines2 = lines1[:]
+    for _ in range(nb_edits):
+        position = rng.randrange(len(lines2))
+        match rng.randrange(3):
+            case 0:
+                lines2.insert(position, f"<span>added {rng.randrange(1000)}</span>")
+            case 1:
+                del lines2[position]
+            case 2:
+                lines2[position] = rng.choice(patterns)
+    return lines1, lines2
+
+
+@cli.command('diff', help="compare the diff engines on large synthetic file pairs")
+@click.option('-l', '--lines', 'nb_lines', type=int, default=5000, help="number of lines per file")
+@click.option('-e', '--edits', 'nb_edits', type=int, default=50, help="number of edits")
+def diff_bench(nb_lines, nb_edits):
+    lines1, lines2 = synthetic_pair(nb_lines, nb_edits)
+    results = []
+    hunks = {}
+    for name, engine in DIFF_ENGINES.items():
+        seconds, diff = timed(lambda: list(engine.unified(lines1, lines2)))
+        results.append((name, seconds))
+        hunks[name] = diff
+    report(f"diff - {nb_lines} lines x {nb_edits} edits", results)
+    for name, diff in hunks.items():
+        changes = sum(1 for line in diff if line[:1] in '+-') - 2
+        same = "same hunks as difflib" if diff == hunks['difflib'] else "other hunks"
+        print(f"{name:>20}: {changes} changed lines - {same}")
+    return 0
+
+
+# the pipeline phases, in the order they run; each one runs in a
+# fresh interpreter through the phase command, see measured()
+def phase_tofolders(tmp: Path):
+    steps.tofolders(tmp / "repo", tmp / "steps")
+
+
+def phase_togit(tmp: Path):
+    steps.togit(tmp / "togit", input_steps_folder=tmp / "steps")
+
+
+def phase_chain_dirs(tmp: Path, jobs=1):
+    trees = [stepstohike.FolderTree(path, only_git=False)
+             for path in sorted((tmp / "steps").glob("[0-9]*"))]
+    stepstohike.write_chain(trees, False, jobs, None, None,
+                            tmp / "single" / "AUTO", tmp / "scrolly" / "AUTO")
+
+
+def phase_fillauto(tmp: Path):
+    # fillauto is chatty on stdout
+    with contextlib.redirect_stdout(io.StringIO()):
+        for layout in ("single", "scrolly"):
+            fillauto.handle_folder(tmp / layout)
+
+
+PHASES = {
+    'tofolders': phase_tofolders,
+    'togit': phase_togit,
+    'chain-dirs': phase_chain_dirs,
+    'fillauto': phase_fillauto,
+}
+
+
+def peak_rss() -> int:
+    """
+    the peak RSS of this process in kB since its last exec; unlike ru_maxrss,
+    this does not carry over the RSS of the process that forked it
+    """
+    for line in Path("/proc/self/status").read_text().splitlines():
+        if line.startswith("VmHWM:"):
+            return int(line.split()[1])
+
+
+def measured(name, tmp: Path, jobs=1):
+    """
+    run a phase in a fresh interpreter, so that its memory figures
+    are not inflated by whatever the benchmark process holds
+
+    returns the wall time, the peak RSS in MB of the phase process,
+    and how much that grew over its baseline, once all is imported;
+    the subprocesses - git, or the chain-dirs workers - are not included
+    """
+    result = tmp / "phase.json"
+    completed = sp.run([sys.executable, __file__, 'phase', name, str(tmp), str(jobs)],
+                       stdout=sp.DEVNULL)
+    if completed.returncode != 0:
+        error(f"phase {name} failed")
+        sys.exit(1)
+    seconds, baseline, peak = json.loads(result.read_text())
+    return seconds, peak / 1024, (peak - baseline) / 1024
+
+
+@cli.command('phase', help="run one phase of the pipeline benchmark - used by pipeline")
+@click.argument('name', type=click.Choice(list(PHASES)))
+@click.argument('tmp', type=Path)
+@click.argument('jobs', type=int)
+def phase_bench(name, tmp, jobs):
+    args = (tmp, jobs) if name == 'chain-dirs' else (tmp,)
+    baseline = peak_rss()
+    start = time.perf_counter()
+    PHASES[name](*args)
+    seconds = time.perf_counter() - start
+    (tmp / "phase.json").write_text(json.dumps([seconds, baseline, peak_rss()]))
+
+
+def folder_size(folder: Path) -> int:
+    return sum(path.stat().st_size for path in folder.rglob("*") if path.is_file())
+
+
+def tooling_commit():
+    """
+    the commit of the tooling being measured, so results can be compared
+    """
+    completed = sp.run(['git', '-C', str(Path(__file__).parent), 'describe',
+                        '--always', '--dirty'], capture_output=True)
+    return completed.stdout.decode().strip() or None
+
+
+@cli.command('pipeline', help="time each phase of the pipeline on a synthetic steps repo")
+@click.option('-s', '--steps', 'nb_steps', type=int, default=100, help="number of steps")
+@click.option('-f', '--files', 'nb_files', type=int, default=20, help="number of files")
+@click.option('-l', '--lines', 'nb_lines', type=int, default=100, help="number of lines per file")
+@click.option('-c', '--churn', type=float, default=0.1, help="fraction of the files changed in each step")
+@click.option('-j', '--jobs', type=int, default=1, help="number of worker processes for chain-dirs - 0 means one per cpu")
+@click.option('-o', '--output', type=Path, default=None, help="save the results in this JSON file")
+def pipeline_bench(nb_steps, nb_files, nb_lines, churn, jobs, output):
+    git_identity()
+    parameters = dict(steps=nb_steps, files=nb_files, lines=nb_lines, churn=churn, jobs=jobs)
+    phases = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        synthetic_repo(tmp / "repo", nb_steps=nb_steps, nb_files=nb_files,
+                       nb_lines=nb_lines, churn=churn)
+        for layout in ("single", "scrolly"):
+            (tmp / layout).mkdir()
+            (tmp / layout / "page.mdx.j2").write_text("# benchmark\n\n{{AUTO}}\n")
+        for name in PHASES:
+            seconds, peak, increase = measured(name, tmp, jobs)
+            # the amount of data that each phase goes through
+            if name == 'fillauto':
+                size = sum(folder_size(tmp / layout) for layout in ("single", "scrolly"))
+            else:
+                size = folder_size(tmp / "steps")
+            phases[name] = dict(
+                seconds=seconds, steps_per_second=nb_steps / seconds,
+                mb_per_second=size / seconds / 2**20,
+                peak_rss_mb=peak, rss_increase_mb=increase)
+    print(f"===== pipeline - {nb_steps} steps x {nb_files} files x {nb_lines} lines")
+    print(f"{'phase':>12} {'seconds':>9} {'steps/s':>9} {'MB/s':>8} {'rss MB':>8} {'+rss MB':>8}")
+    for name, phase in phases.items():
+        print(f"{name:>12} {phase['seconds']:9.3f} {phase['steps_per_second']:9.1f}"
+              f" {phase['mb_per_second']:8.2f} {phase['peak_rss_mb']:8.1f}"
+              f" {phase['rss_increase_mb']:8.1f}")
+    if output is not None:
+        results = dict(
+            date=datetime.now().isoformat(timespec='seconds'),
+            commit=tooling_commit(), python=platform.python_version(),
+            parameters=parameters, phases=phases)
+        output.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"results saved in {output}")
+    return 0
+
+
+@cli.command('compare', help="compare two JSON results of the pipeline benchmark")
+@click.argument('before', type=Path)
+@click.argument('after', type=Path)
+def compare_bench(before, after):
+    before, after = (json.loads(path.read_text()) for path in (before, after))
+    if before['parameters'] != after['parameters']:
+        warning(f"the parameters differ: {before['parameters']} vs {after['parameters']}")
+    print(f"===== {before['commit']} -> {after['commit']}")
+    print(f"{'phase':>12} {'before':>9} {'after':>9} {'speedup':>8} {'rss MB':>15} {'+rss MB':>15}")
+    for name, phase in after['phases'].items():
+        if name not in before['phases']:
+            continue
+        old = before['phases'][name]
+        # older results have no rss_increase_mb
+        increases = [f"{results.get('rss_increase_mb', float('nan')):.1f}"
+                     for results in (old, phase)]
+        print(f"{name:>12} {old['seconds']:9.3f} {phase['seconds']:9.3f}"
+              f" x{old['seconds'] / phase['seconds']:7.2f}"
+              f" {old['peak_rss_mb']:7.1f}->{phase['peak_rss_mb']:<7.1f}"
+              f" {increases[0]:>7}->{increases[1]:<7}")
+    return 0
+
+
+if __name__ == '__main__':
+    cli()
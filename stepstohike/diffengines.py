@@ -0,0 +1,368 @@
+"""
+the diff engines that stepstohike.py can use to compare two versions of a file
+
+all engines produce unified diff lines - like difflib.unified_diff does -
+that stepstohike.diff_lines turns into DiffWriter annotations; so two engines
+that come up with the same hunks produce the exact same output
+
+- difflib: the historical engine, the default
+- myers: an in-process implementation of the Myers O(ND) algorithm,
+  that falls back to difflib above MAX_COST edits
+- histogram: an in-process implementation of the histogram algorithm,
+  as in git diff --histogram, that behaves much better than difflib on
+  long files with many repeated lines
+- git: delegates to git diff --no-index --histogram
+"""
+
+import difflib
+import tempfile
+from pathlib import Path
+
+import timings
+
+# the default amount of context lines, like difflib and git
+CONTEXT = 3
+
+
+def format_range(start, stop):
+    """
+    like difflib, convert a range to the "ed" format used in hunk headers
+    """
+    beginning = start + 1
+    length = stop - start
+    if length == 1:
+        return f"{beginning}"
+    if not length:
+        beginning -= 1
+    return f"{beginning},{length}"
+
+
+def unified_from_opcodes(lines1, lines2, opcodes, fromfile='', tofile='', n=CONTEXT):
+    """
+    the unified diff lines, given the opcodes of a SequenceMatcher-like object
+    this produces the same lines as difflib.unified_diff for the same opcodes
+    """
+    started = False
+    for group in grouped_opcodes(opcodes, n):
+        if not started:
+            started = True
+            yield f"--- {fromfile}\n"
+            yield f"+++ {tofile}\n"
+        first, last = group[0], group[-1]
+        file1_range = format_range(first[1], last[2])
+        file2_range = format_range(first[3], last[4])
+        yield f"@@ -{file1_range} +{file2_range} @@\n"
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                for line in lines1[i1:i2]:
+                    yield ' ' + line
+                continue
+            if tag in {'replace', 'delete'}:
+                for line in lines1[i1:i2]:
+                    yield '-' + line
+            if tag in {'replace', 'insert'}:
+                for line in lines2[j1:j2]:
+                    yield '+' + line
+
+
+class OpcodesMatcher(difflib.SequenceMatcher):
+    """
+    a SequenceMatcher with precomputed opcodes
+    so that we can reuse its get_grouped_opcodes
+    """
+
+    def __init__(self, opcodes):
+        self.opcodes = opcodes
+
+    def get_opcodes(self):
+        return self.opcodes
+
+
+def grouped_opcodes(opcodes, n=CONTEXT):
+    return OpcodesMatcher(opcodes).get_grouped_opcodes(n)
+
+
+def opcodes_from_matches(matches, n1, n2):
+    """
+    turn a sorted list of matching (i, j) index pairs into opcodes
+    """
+    opcodes = []
+    i = j = 0
+    index = 0
+    while index < len(matches):
+        mi, mj = matches[index]
+        if mi > i and mj > j:
+            opcodes.append(('replace', i, mi, j, mj))
+        elif mi > i:
+            opcodes.append(('delete', i, mi, j, j))
+        elif mj > j:
+            opcodes.append(('insert', i, i, j, mj))
+        # extend the block of consecutive matches
+        length = 1
+        while (index + length < len(matches)
+               and matches[index + length] == (mi + length, mj + length)):
+            length += 1
+        opcodes.append(('equal', mi, mi + length, mj, mj + length))
+        i, j = mi + length, mj + length
+        index += length
+    if i < n1 and j < n2:
+        opcodes.append(('replace', i, n1, j, n2))
+    elif i < n1:
+        opcodes.append(('delete', i, n1, j, j))
+    elif j < n2:
+        opcodes.append(('insert', i, i, j, n2))
+    if not opcodes:
+        opcodes.append(('equal', 0, 0, 0, 0))
+    return opcodes
+
+
+# above that many edits, the greedy Myers algorithm - quadratic in the
+# number of edits, both in time and in memory - gives up; this happens
+# e.g. on a file that gets rewritten entirely
+MAX_COST = 500
+
+
+def myers_matches(a, b, a_lo, a_hi, b_lo, b_hi, max_cost=MAX_COST):
+    """
+    the matching (i, j) pairs of a shortest edit script between
+    a[a_lo:a_hi] and b[b_lo:b_hi], using the greedy Myers algorithm
+    or None if that script has more than max_cost edits
+    """
+    n, m = a_hi - a_lo, b_hi - b_lo
+    offset = n + m + 1
+    v = [0] * (2 * offset + 1)
+    trace = []
+    found = False
+    for d in range(n + m + 1):
+        if d > max_cost:
+            return None
+        trace.append(v[offset - d - 1:offset + d + 2])
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]
+            else:
+                x = v[offset + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[a_lo + x] == b[b_lo + y]:
+                x += 1
+                y += 1
+            v[offset + k] = x
+            if x >= n and y >= m:
+                found = True
+                break
+        if found:
+            break
+    # walk back the trace
+    matches = []
+    x, y = n, m
+    for d in range(len(trace) - 1, 0, -1):
+        # trace[d] is v before round d, for k in [-d-1, d+1]
+        snapshot = trace[d]
+        k = x - y
+        if k == -d or (k != d and snapshot[k - 1 + d + 1] < snapshot[k + 1 + d + 1]):
+            prev_k = k + 1
+        else:
+            prev_k = k - 1
+        prev_x = snapshot[prev_k + d + 1]
+        prev_y = prev_x - prev_k
+        # the snake that ends in (x, y)
+        while x > prev_x and y > prev_y:
+            x -= 1
+            y -= 1
+            matches.append((a_lo + x, b_lo + y))
+        x, y = prev_x, prev_y
+    # the initial snake from (0, 0)
+    while x > 0 and y > 0:
+        x -= 1
+        y -= 1
+        matches.append((a_lo + x, b_lo + y))
+    matches.reverse()
+    return matches
+
+
+def difflib_matches(a, b, a_lo, a_hi, b_lo, b_hi):
+    """
+    the matching (i, j) pairs found by difflib in a[a_lo:a_hi] and b[b_lo:b_hi]
+    not minimal, but fast on very different sequences
+    """
+    matcher = difflib.SequenceMatcher(None, a[a_lo:a_hi], b[b_lo:b_hi])
+    return [(a_lo + i + k, b_lo + j + k)
+            for i, j, size in matcher.get_matching_blocks()
+            for k in range(size)]
+
+
+def bounded_matches(a, b, a_lo, a_hi, b_lo, b_hi):
+    """
+    myers_matches, or difflib_matches when there are too many edits
+    """
+    matches = myers_matches(a, b, a_lo, a_hi, b_lo, b_hi)
+    if matches is None:
+        return difflib_matches(a, b, a_lo, a_hi, b_lo, b_hi)
+    return matches
+
+
+# like git, ignore the lines that occur too often to be a meaningful anchor
+MAX_CHAIN = 64
+
+
+def histogram_matches(a, b):
+    """
+    the matching (i, j) pairs for a and b, using the histogram algorithm:
+    in each region, anchor on the longest common block that contains
+    the rarest lines, and recurse on both sides of it;
+    regions with no usable anchor are handled with myers
+    """
+    matches = []
+    regions = [(0, len(a), 0, len(b))]
+    while regions:
+        a_lo, a_hi, b_lo, b_hi = regions.pop()
+        # common prefix and suffix
+        while a_lo < a_hi and b_lo < b_hi and a[a_lo] == b[b_lo]:
+            matches.append((a_lo, b_lo))
+            a_lo += 1
+            b_lo += 1
+        while a_lo < a_hi and b_lo < b_hi and a[a_hi - 1] == b[b_hi - 1]:
+            a_hi -= 1
+            b_hi -= 1
+            matches.append((a_hi, b_hi))
+        if a_lo == a_hi or b_lo == b_hi:
+            continue
+        histogram = {}
+        for i in range(a_lo, a_hi):
+            histogram.setdefault(a[i], []).append(i)
+        # like in git, best is (count, a_start, a_end, b_start) where count is
+        # the lowest occurrence count in the block; a candidate block replaces
+        # the best one if it is longer, or if it contains rarer lines
+        best = None
+        j = b_lo
+        while j < b_hi:
+            positions = histogram.get(b[j])
+            if not positions or len(positions) > MAX_CHAIN:
+                j += 1
+                continue
+            if best is not None and len(positions) > best[0]:
+                j += 1
+                continue
+            next_j = j + 1
+            for i in positions:
+                count = len(positions)
+                start_a, start_b = i, j
+                while start_a > a_lo and start_b > b_lo and a[start_a - 1] == b[start_b - 1]:
+                    start_a -= 1
+                    start_b -= 1
+                    count = min(count, len(histogram[a[start_a]]))
+                end_a, end_b = i + 1, j + 1
+                while end_a < a_hi and end_b < b_hi and a[end_a] == b[end_b]:
+                    count = min(count, len(histogram[a[end_a]]))
+                    end_a += 1
+                    end_b += 1
+                if (best is None or end_a - start_a > best[2] - best[1]
+                        or count < best[0]):
+                    best = (count, start_a, end_a, start_b)
+                next_j = max(next_j, end_b)
+            j = next_j
+        if best is None:
+            matches.extend(bounded_matches(a, b, a_lo, a_hi, b_lo, b_hi))
+            continue
+        _, start_a, end_a, start_b = best
+        length = end_a - start_a
+        matches.extend((start_a + k, start_b + k) for k in range(length))
+        regions.append((a_lo, start_a, b_lo, start_b))
+        regions.append((end_a, a_hi, start_b + length, b_hi))
+    matches.sort()
+    return matches
+
+
+class DiffEngine:
+    """
+    the interface common to all engines
+    """
+
+    name = None
+
+    def unified(self, lines1, lines2, fromfile='', tofile=''):
+        """
+        the unified diff lines between two lists of lines (without line endings)
+        """
+        raise NotImplementedError
+
+
+class InProcessEngine(DiffEngine):
+    """
+    the engines that compute the opcodes themselves, like a SequenceMatcher
+    """
+
+    def unified(self, lines1, lines2, fromfile='', tofile=''):
+        return unified_from_opcodes(
+            lines1, lines2, self.opcodes(lines1, lines2), fromfile, tofile)
+
+    def opcodes(self, lines1, lines2):
+        raise NotImplementedError
+
+
+class DifflibEngine(InProcessEngine):
+
+    name = 'difflib'
+
+    def unified(self, lines1, lines2, fromfile='', tofile=''):
+        return difflib.unified_diff(lines1, lines2, fromfile, tofile)
+
+    def opcodes(self, lines1, lines2):
+        return difflib.SequenceMatcher(None, lines1, lines2).get_opcodes()
+
+
+class MyersEngine(InProcessEngine):
+
+    name = 'myers'
+
+    def opcodes(self, lines1, lines2):
+        matches = bounded_matches(lines1, lines2, 0, len(lines1), 0, len(lines2))
+        return opcodes_from_matches(matches, len(lines1), len(lines2))
+
+
+class HistogramEngine(InProcessEngine):
+
+    name = 'histogram'
+
+    def opcodes(self, lines1, lines2):
+        matches = histogram_matches(lines1, lines2)
+        return opcodes_from_matches(matches, len(lines1), len(lines2))
+
+
+class GitEngine(DiffEngine):
+    """
+    runs git diff --no-index --histogram on temporary files
+    """
+
+    name = 'git'
+
+    def unified(self, lines1, lines2, fromfile='', tofile=''):
+        with tempfile.TemporaryDirectory() as tmp:
+            file1, file2 = Path(tmp) / "a", Path(tmp) / "b"
+            file1.write_text("".join(f"{line}\n" for line in lines1))
+            file2.write_text("".join(f"{line}\n" for line in lines2))
+            completed = timings.run(
+                ['git', 'diff', '--no-index', '--no-color', '--no-ext-diff',
+                 '--histogram', f'-U{CONTEXT}', str(file1), str(file2)],
+                capture_output=True)
+        # 1 means there are differences
+        if completed.returncode not in (0, 1):
+            raise RuntimeError(completed.stderr.decode())
+        output = completed.stdout.decode().split("\n")
+        started = False
+        for line in output:
+            if line.startswith('@@'):
+                if not started:
+                    started = True
+                    yield f"--- {fromfile}\n"
+                    yield f"+++ {tofile}\n"
+                # drop the function context that git adds after the header
+                yield line[:line.index('@@', 2) + 2] + "\n"
+            elif started and line[:1] in (' ', '-', '+'):
+                yield line
+
+
+DIFF_ENGINES = {
+    engine.name: engine
+    for engine in (DifflibEngine(), MyersEngine(), HistogramEngine(), GitEngine())
+}
@@ -1,41 +1,94 @@
 #!/usr/bin/env python
 
+import json
 from argparse import ArgumentParser
 from pathlib import Path
 
 from jinja2 import Environment
 
-def handle_folder(folder):
+# in the shards folder, as written by stepstohike.py --shards
+SHARDS_INDEX = "index.json"
+
+def write_if_changed(path, text):
+    """
+    write text in path, unless it already has that exact content
+    so that watchers - like the nextjs dev server - do not get triggered
+    returns True if the file was written
+    """
+    if path.exists() and path.read_text() == text:
+        return False
+    with path.open('w') as file_out:
+        file_out.write(text)
+    return True
+
+
+def shards_auto(folder, shards):
+    """
+    the mdx to insert in place of {{AUTO}} for a sharded output:
+    one TableOfContentsItem per shard, whose content is imported from the
+    shard file; the page is still rendered as a whole in the static export,
+    but each shard is a separate module for the dev server to compile
+    """
+    index = json.loads((folder / shards / SHARDS_INDEX).read_text())
+    lines = []
+    for n, shard in enumerate(index):
+        lines.append(f"import Shard{n} from './{shards}/{shard['file']}'")
+    lines.append("")
+    for n, shard in enumerate(index):
+        lines.append(f"<TableOfContentsItem topic='{shard['topic']}'"
+                     f" label='{shard['label']}' tooltip='{shard['tooltip']}'>")
+        lines.extend(["", f"<Shard{n} />", "", "</TableOfContentsItem>", ""])
+    return "\n".join(lines)
+
+
+def handle_folder(folder, shards=None, auto=None):
     """
     in provided folder:
     - looks for a file named AUTO
     - looks for all files named *.j2
     - and in each replace {{AUTO}} with the content of AUTO
+    the outputs are rewritten only if their content has changed
+
+    with shards set - the name of a subfolder written by stepstohike.py --shards -
+    {{AUTO}} is replaced with the imports of the shards instead
+
+    with auto set - the text computed in the same process, see pipeline.py -
+    the AUTO file is not read at all
     """
-    auto_file = folder / 'AUTO'
-    if not auto_file.exists():
-        print(f"File AUTO not found in {folder}")
-        return
-    with auto_file.open() as file_in:
-        AUTO = file_in.read()
+    if auto is not None:
+        AUTO = auto
+    elif shards is not None:
+        if not (folder / shards / SHARDS_INDEX).exists():
+            print(f"File {shards}/{SHARDS_INDEX} not found in {folder}")
+            return
+        AUTO = shards_auto(folder, shards)
+    else:
+        auto_file = folder / 'AUTO'
+        if not auto_file.exists():
+            print(f"File AUTO not found in {folder}")
+            return
+        with auto_file.open() as file_in:
+            AUTO = file_in.read()
     for template_path in folder.glob('*.j2'):
         environment = Environment()
         with template_path.open() as file_in:
             template = environment.from_string(file_in.read())
         output = template_path.parent / template_path.stem
-        with output.open('w') as file_out:
-            rendered = template.render(AUTO=AUTO)
-            file_out.write(rendered)
-        print(f"{output} (over)written")
+        if write_if_changed(output, template.render(AUTO=AUTO)):
+            print(f"{output} (over)written")
+        else:
+            print(f"{output} unchanged")
 
 
 def main():
     parser = ArgumentParser()
+    parser.add_argument('--shards', default=None,
+                        help="use the shards in this subfolder instead of AUTO")
     parser.add_argument('folders', type=Path, nargs='+')
     args = parser.parse_args()
 
     for folder in args.folders:
-        handle_folder(folder)
+        handle_folder(folder, args.shards)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+"""
+the whole AUTO pipeline in a single Python process
+
+this does what `redo.sh all` used to do with one interpreter per stage:
+- extract the steps from the git repo into the steps folder, like
+  `steps.py tofolders --incremental`
+- render the single column and scrollycoding outputs from these folders,
+  like `stepstohike.py chain-dirs --all-files`
+- fill the .j2 templates in the target folders, like `fillauto.py`
+
+the step folders returned by the extraction are rendered as-is, each one
+scanned and read only once for both layouts; and the rendered text is
+passed straight to the templates, without the round trip through the AUTO files
+"""
+
+import os
+import io
+import sys
+from pathlib import Path
+
+import logging
+logger = logging.getLogger('steps')
+logging.basicConfig(level=logging.INFO)
+
+(debug, info, warning, error) = logger.debug, logger.info, logger.warning, logger.error
+
+import click
+
+import steps
+import stepstohike
+import fillauto
+import timings
+from diffengines import DIFF_ENGINES
+
+
+# the target folders in the app, and the layout rendered in each
+TARGETS = {'singlecolumn': 'single', 'scrollycoding': 'scrolly'}
+
+
+def pipeline(git_repo: Path, app: Path, *, steps_folder: Path | None = None,
+             extract: bool = True, only_git: bool = False,
+             jobs: int = 1, cache_dir: Path | None = None, keep_auto: bool = False,
+             engine: str = 'difflib') -> int:
+    """
+    returns 0 on success, like the steps.py commands
+
+    the outputs go in the TARGETS subfolders of app that exist
+
+    the step folders are refreshed from the repo first - keeping the ones
+    whose tree has not changed - unless extract is unset, in which case they
+    are used as they are, e.g. after local changes; with only_git set, only
+    the files under git in the step folders are considered, like chain-dirs
+
+    with keep_auto set, the AUTO files are written as well - only if their
+    content changes - so that fillauto.py and watch can still use them
+    """
+    if steps_folder is None:
+        steps_folder = git_repo / steps.DOTSTEPS
+    targets = {app / folder: stepstohike.RENDERERS[name]
+               for folder, name in TARGETS.items() if (app / folder).is_dir()}
+    if not targets:
+        error(f"none of {', '.join(TARGETS)} found in {app}")
+        return 1
+    if jobs == 0:
+        jobs = os.cpu_count()
+
+    if extract:
+        folders = steps.tofolders(git_repo, steps_folder, incremental=True)
+        if folders is None:
+            return 1
+    else:
+        folders = sorted(folder for folder in steps_folder.glob("[0-9]*") if folder.is_dir())
+    trees = [stepstohike.FolderTree(folder, only_git) for folder in folders]
+    if len(trees) < 2:
+        error("At least two steps are required for comparison.")
+        return 1
+
+    outputs = {folder: io.StringIO() for folder in targets}
+    stepstohike.chaindirs(
+        trees, [(renderer, outputs[folder]) for folder, renderer in targets.items()],
+        jobs=jobs, cache_dir=cache_dir, engine=engine)
+
+    with timings.phase('fill'):
+        for folder, output in outputs.items():
+            auto = output.getvalue()
+            if keep_auto and fillauto.write_if_changed(folder / 'AUTO', auto):
+                info(f"{folder / 'AUTO'} (over)written")
+            fillauto.handle_folder(folder, auto=auto)
+    return 0
+
+
+@click.group(chain=True, help=sys.modules[__name__].__doc__)
+@click.option("--debug", is_flag=True, help="enable debug output")
+@click.option("--quiet", is_flag=True, help="enable debug output")
+@click.option("--timings", 'with_timings', is_flag=True, help="print on stderr where the time goes")
+@click.option("--timings-trace", type=Path, default=None, help="also save the detailed timings in this JSON file")
+def cli(debug, quiet, with_timings, timings_trace):
+    if debug:
+        logging.getLogger().setLevel(logging.DEBUG)
+    if quiet:
+        logging.getLogger().setLevel(logging.WARNING)
+    if with_timings or timings_trace:
+        timings.enable(timings_trace)
+
+
+@cli.command('run', help="from the steps repo to the filled templates, in one process")
+@click.option('--app', type=Path, required=True, help="the folder that contains singlecolumn/ and scrollycoding/")
+@click.option('-s', '--steps-folder', type=Path, default=None, help="the steps folder, defaults to <git_repo>/.steps")
+@click.option('--extract/--no-extract', default=True, help="refresh the steps folder from the repo first, like tofolders --incremental (the default)")
+@click.option('--only-git', is_flag=True, help="consider only the files under git in the step folders, rather than all files")
+@click.option('--only-changes-with-step', is_flag=True, help="only show changes with a step.md file")
+@click.option('-j', '--jobs', type=int, default=1, help="number of worker processes - 0 means one per cpu")
+@click.option('-c', '--cache-dir', type=Path, default=None, help="keep the rendered fragments in this folder, and render only the pairs that have changed")
+@click.option('--keep-auto', is_flag=True, help="also write the AUTO files, for fillauto.py and watch")
+@click.option('-e', '--diff-engine', type=click.Choice(list(DIFF_ENGINES)), default='difflib', help="the algorithm used to compute the diffs")
+@click.argument('git_repo', type=Path)
+def run_cli(app, steps_folder, extract, only_git, only_changes_with_step,
+            jobs, cache_dir, keep_auto, diff_engine, git_repo):
+    stepstohike.ONLY_CHANGES_WITH_STEP = only_changes_with_step
+    # click ignores the return value, and redo.sh needs to know
+    sys.exit(pipeline(git_repo, app, steps_folder=steps_folder, extract=extract,
+                      only_git=only_git,
+                      jobs=jobs, cache_dir=cache_dir, keep_auto=keep_auto,
+                      engine=diff_engine))
+
+
+if __name__ == "__main__":
+    cli()
@@ -9,6 +9,8 @@ APP=${ROOT}/app
 STEPS_REPO=git@github.com:ue22-p25/backend-flask-chatapp-steps.git
 # where we graft it here
 STEPS=${BIN}/steps-repo
+# where chain-dirs keeps the rendered fragments across runs
+CACHE=${STEPS}/.hike-cache
 
 function clone() {
     if [ ! -d $STEPS ]; then
@@ -31,7 +33,7 @@ function need-pull() {
 
 # compute the steps folder from the git repo
 function tofolders() {
-    $BIN/steps.py tofolders $STEPS
+    $BIN/steps.py tofolders --incremental $STEPS
 }
 
 # create a new branch in the steps repo from the current folders
@@ -42,48 +44,68 @@ function togit() {
 # compute AUTO in singlecolumn
 function toauto-1() {
     local out=$APP/singlecolumn/AUTO
-    python $BIN/stepstohike.py chain-dirs --all-files ${STEPS}/.steps/* > $out
-    echo single column output written in $out
+    python $BIN/stepstohike.py chain-dirs --all-files --jobs 0 --cache-dir $CACHE --out-single $out ${STEPS}/.steps/*
 }
 # compute AUTO in scrollycoding
 function toauto-2() {
     local out=$APP/scrollycoding/AUTO
-    python $BIN/stepstohike.py chain-dirs --all-files --scrolly ${STEPS}/.steps/* > $out
-    echo double column output written in $out
+    python $BIN/stepstohike.py chain-dirs --all-files --jobs 0 --cache-dir $CACHE --out-scrolly $out ${STEPS}/.steps/*
 }
-# both
+# both in a single pass
 function toauto() {
-    toauto-1
-    toauto-2
+    python $BIN/stepstohike.py chain-dirs --all-files --jobs 0 --cache-dir $CACHE \
+        --out-single $APP/singlecolumn/AUTO --out-scrolly $APP/scrollycoding/AUTO ${STEPS}/.steps/*
+}
+# both in a single pass, straight from the steps repo without going through .steps
+function gittoauto() {
+    python $BIN/stepstohike.py chain-git --jobs 0 --cache-dir $CACHE \
+        --out-single $APP/singlecolumn/AUTO --out-scrolly $APP/scrollycoding/AUTO $STEPS
 }
 # use the .je template and the AUTO files to create the final output
 function fill() {
     python $BIN/fillauto.py $APP/scrollycoding $APP/singlecolumn
 }
 
+# tofolders --incremental, both renderings from .steps and fill, in a single python process
+# the rendered text goes straight into the templates, the AUTO files are not used
+function pipeline() {
+    python $BIN/pipeline.py run --jobs 0 --cache-dir $CACHE --app $APP "$@" $STEPS
+}
+
 # the full monty
 function all() {
     clone
     need-pull
-    tofolders
-    toauto
-    fill
+    pipeline
+}
+
+# keep AUTO and the templates outputs up to date while editing .steps
+# only the step pairs that have changed get rendered again
+function watch() {
+    python $BIN/stepstohike.py watch --all-files \
+        --out-single $APP/singlecolumn/AUTO --out-scrolly $APP/scrollycoding/AUTO ${STEPS}/.steps
 }
 
 ###########
 # compute the output, using the folders as reference
 function fromfolders() {
-    toauto
-    fill
+    pipeline --no-extract
 }
 
 # compute the output, using the steps repo as reference
 function fromgit() {
-    tofolders
-    toauto
+    gittoauto
     fill
 }
 
+# same, but with the single column page sharded in one mdx per step
+function fromgit-sharded() {
+    python $BIN/stepstohike.py chain-git --jobs 0 --cache-dir $CACHE \
+        --out-scrolly $APP/scrollycoding/AUTO --shards $APP/singlecolumn/shards $STEPS
+    python $BIN/fillauto.py $APP/scrollycoding
+    python $BIN/fillauto.py --shards shards $APP/singlecolumn
+}
+
 # display the recipe to adopt the latest created branch as main in the steps repo
 function savegit() {
     echo "===== the recipe:"
@@ -98,17 +120,15 @@ function savegit() {
 TESTSTEPS=${STEPS}/.steps/0[0-4]*
 function testauto-1() {
     local out=$APP/singlecolumn/AUTO
-    python $BIN/stepstohike.py chain-dirs --all-files $TESTSTEPS > $out
-    echo single column output written in $out
+    python $BIN/stepstohike.py chain-dirs --all-files --out-single $out $TESTSTEPS
 }
 function testauto-2() {
     local out=$APP/scrollycoding/AUTO
-    python $BIN/stepstohike.py chain-dirs --all-files --scrolly $TESTSTEPS > $out
-    echo double column output written in $out
+    python $BIN/stepstohike.py chain-dirs --all-files --out-scrolly $out $TESTSTEPS
 }
 function testauto() {
-    testauto-1
-    testauto-2
+    python $BIN/stepstohike.py chain-dirs --all-files \
+        --out-single $APP/singlecolumn/AUTO --out-scrolly $APP/scrollycoding/AUTO $TESTSTEPS
 }
 function test() {
     testauto
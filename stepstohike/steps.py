@@ -4,12 +4,17 @@
 A tool for managing a set of steps, as either a git repository or a folder hierarchy
 """
 
+import os
 import sys
 import re
+import json
+import shutil
 from os import chdir
 from pathlib import Path
 import subprocess as sp
 from itertools import count
+from collections import Counter
+from stat import S_ISLNK
 
 import logging
 logger = logging.getLogger('steps')
@@ -19,6 +24,8 @@ logging.basicConfig(level=logging.INFO)
 
 import click
 
+import timings
+
 
 COMMIT_RE = r"step (?P<step>\w+) - (?P<message>.+)"
 HASH_COMMIT_RE = r"(?P<hash>[0-9a-f]+) " + COMMIT_RE
@@ -29,11 +36,19 @@ HASH_COMMIT_MATCHER = re.compile("^"+HASH_COMMIT_RE+"$")
 README_MATCHER = re.compile("^"+README_RE+"$")
 
 DOTSTEPS = ".steps"
+# in the steps folder, keeps track of the commit and tree used for each step
+MANIFEST = ".manifest.json"
+# in the steps folder, the content-addressed store for hardlinked steps
+BLOBS = ".blobs"
+
+# read the umask once, to compute the permissions of executable files
+UMASK = os.umask(0o022)
+os.umask(UMASK)
 
 
 def shell(command: str, **kwds) -> sp.CompletedProcess:
     debug(f"running command: {command}")
-    completed = sp.run(command, shell=True, **kwds)
+    completed = timings.run(command, shell=True, **kwds)
     # if completed.returncode != 0:
     #     error(f"WHOOOPS - Command failed: {command}")
     return completed
@@ -46,26 +61,11 @@ def shell_capture(command: str, **kwds) -> sp.CompletedProcess:
     return completed.stdout.decode().strip()
 
 
-# temporary
-def retrieve_message_from_commit(repo, step, branch):
-    """
-    normally the one-liner attached to a step is in step.md
-    however as a last resort
-    when bootstrapping from a git repository
-    we may find the message in the log messages
-    """
-    command = f"git -C {repo} log --oneline {branch} --grep='step {step} -'"
-    line = shell_capture(command)
-    if match := COMMIT_MATCHER.match(line):
-        return match.group('step'), match.group("message")
-    return "unknown", "cannot find message"
-
-
 def retrieve_message_from_step_md(repo):
     step_md_file = repo / "step.md"
     if not step_md_file.exists():
         warning(f"!! {step_md_file} does not exist")
-        return "unknown", "cannot find message"
+        return None, None
     with step_md_file.open() as f:
         content = f.read()
         if match := README_MATCHER.match(content):
@@ -75,7 +75,32 @@ def retrieve_message_from_step_md(repo):
             warning(content)
             warning(f"!!! WARNING !!! {step_md_file} end")
 
-    return None, "cannot find message"
+    return None, None
+
+
+def retrieve_messages(repo: Path, input_steps_folder: Path, steps, branch: str = "main") -> dict:
+    """
+    normally the one-liner attached to a step is in its step.md
+    however as a last resort
+    when bootstrapping from a git repository
+    we may find the message in the log messages of branch in repo;
+    these are all scanned in a single git log, and only if needed
+    """
+    messages = {}
+    for step in steps:
+        _, messages[step] = retrieve_message_from_step_md(input_steps_folder / step)
+    needed = [str(step) for step, message in messages.items() if not message]
+    if not needed:
+        return messages
+    index = StepIndex(repo, branch) if (repo / ".git").is_dir() else None
+    if index is None:
+        warning(f"!!! no git repo in {repo} to find messages for steps {' '.join(needed)}")
+    else:
+        index.check(expected=needed)
+    for step, message in messages.items():
+        if not message:
+            messages[step] = (index and index.message(str(step))) or "cannot find message"
+    return messages
 
 
 # temporary
@@ -112,6 +137,215 @@ def strip_docstring(path: Path) -> str:
     return message
 
 
+class GitObjects:
+    """
+    a long-lived `git cat-file --batch` process
+    that reads objects from a repo without spawning one process for each
+    """
+
+    def __init__(self, repo: Path):
+        self.process = timings.popen(
+            ['git', '-C', str(repo), 'cat-file', '--batch'],
+            stdin=sp.PIPE, stdout=sp.PIPE)
+        # parsed trees, as the same subtrees show up in many steps
+        self.trees = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+    def read(self, name: str) -> tuple[str, bytes]:
+        """
+        returns the type and contents of an object
+        """
+        self.process.stdin.write(f"{name}\n".encode())
+        self.process.stdin.flush()
+        header = self.process.stdout.readline().decode().split()
+        if len(header) != 3:
+            raise KeyError(f"cannot read git object {name}")
+        _, kind, size = header
+        data = timings.read(self.process.stdout.read(int(size)))
+        # each object is followed by a newline
+        self.process.stdout.read(1)
+        return kind, data
+
+    def tree(self, sha: str) -> list[tuple[str, str, str]]:
+        """
+        the (mode, name, sha) entries in a tree
+        """
+        if sha not in self.trees:
+            kind, data = self.read(sha)
+            if kind != 'tree':
+                raise ValueError(f"git object {sha} is a {kind}, not a tree")
+            entries = []
+            index = 0
+            while index < len(data):
+                space = data.index(b' ', index)
+                nul = data.index(b'\0', space)
+                mode = data[index:space].decode()
+                name = data[space+1:nul].decode()
+                entries.append((mode, name, data[nul+1:nul+21].hex()))
+                index = nul + 21
+            self.trees[sha] = entries
+        return self.trees[sha]
+
+    def walk(self, sha: str, prefix: str = ""):
+        """
+        yields (path, mode, sha) for all the blobs in a tree, recursively
+        """
+        for mode, name, entry_sha in self.tree(sha):
+            path = f"{prefix}{name}"
+            if mode == '40000':
+                yield from self.walk(entry_sha, f"{path}/")
+            # submodules have no contents in this repo
+            elif mode != '160000':
+                yield path, mode, entry_sha
+
+    def extract(self, sha: str, folder: Path, store=None):
+        """
+        write all the files in a tree under folder
+        if a BlobStore is provided, the files are hardlinks to the store
+        """
+        for path, mode, blob_sha in self.walk(sha):
+            target = folder / path
+            target.parent.mkdir(parents=True, exist_ok=True)
+            if store is not None and mode != '120000':
+                store.link(self, blob_sha, mode, target)
+                continue
+            _, data = self.read(blob_sha)
+            if mode == '120000':
+                target.symlink_to(data.decode())
+                continue
+            target.write_bytes(timings.written(data))
+            if mode == '100755':
+                target.chmod(0o777 & ~UMASK)
+
+
+class BlobStore:
+    """
+    a content-addressed store of files, keyed on their git blob hash
+    so that identical files in several steps can be hardlinks to the same inode
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def path(self, sha: str, mode: str) -> Path:
+        # the mode is shared by all the hardlinks, so it is part of the key
+        suffix = ".x" if mode == '100755' else ""
+        return self.root / sha[:2] / f"{sha}{suffix}"
+
+    def link(self, objects: GitObjects, sha: str, mode: str, target: Path):
+        blob = self.path(sha, mode)
+        if not blob.exists():
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            _, data = objects.read(sha)
+            blob.write_bytes(data)
+            # read-only, so that editing a file in place - which would change
+            # it in all the steps that share it - fails instead
+            blob.chmod((0o555 if mode == '100755' else 0o444) & ~UMASK)
+        os.link(blob, target)
+
+    def collect(self):
+        """
+        remove the blobs that are no longer used in any step folder,
+        then the fan-out folders that are left empty, and the store
+        itself when nothing is hardlinked any more
+        """
+        for fanout in self.root.iterdir():
+            for blob in fanout.iterdir():
+                if blob.stat().st_nlink == 1:
+                    debug(f"removing unused blob {blob.name}")
+                    blob.unlink()
+            if not any(fanout.iterdir()):
+                fanout.rmdir()
+        if not any(self.root.iterdir()):
+            debug(f"removing the empty store {self.root}")
+            self.root.rmdir()
+
+
+class StepIndex:
+    """
+    the steps found in a branch, scanned in a single git log
+
+    only the commits that match COMMIT_RE are considered; entries is the
+    list of (commit, tree, step, message), older first, and if several
+    commits have the same step id, the most recent one wins in by_step
+    """
+
+    def __init__(self, git_repo: Path, branch: str = "HEAD"):
+        self.git_repo = git_repo
+        self.branch = branch
+        # the raw output, NUL-separated, as stripping it would break
+        # the record of a commit with an empty subject
+        with timings.phase('step index'):
+            completed = timings.run(
+                ['git', '-C', str(git_repo), 'log', '-z', '--first-parent',
+                 '--format=%H %T %s', branch], capture_output=True)
+        self.entries = []
+        for record in completed.stdout.decode().split("\0")[::-1]:
+            parts = record.split(" ", 2)
+            if len(parts) != 3:
+                continue
+            commit, tree, subject = parts
+            if match := COMMIT_MATCHER.match(subject):
+                self.entries.append(
+                    (commit, tree, match.group("step"), match.group("message")))
+        self.by_step = {entry[2]: entry for entry in self.entries}
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, step):
+        return step in self.by_step
+
+    def message(self, step: str) -> str | None:
+        entry = self.by_step.get(step)
+        return entry[3] if entry else None
+
+    def duplicates(self) -> list[str]:
+        counts = Counter(entry[2] for entry in self.entries)
+        return sorted(step for step, number in counts.items() if number > 1)
+
+    def missing(self, expected=None) -> list[str]:
+        """
+        the ids in expected that are not in the index; if expected is not
+        given, and all ids are numbers, the gaps in the numbering
+        """
+        if expected is not None:
+            return [step for step in expected if step not in self.by_step]
+        if not self.by_step or not all(step.isdigit() for step in self.by_step):
+            return []
+        numbers = {int(step) for step in self.by_step}
+        width = len(next(iter(self.by_step)))
+        return [f"{number:0{width}d}"
+                for number in range(min(numbers), max(numbers) + 1)
+                if number not in numbers]
+
+    def check(self, expected=None) -> bool:
+        """
+        warn about duplicate and missing step ids; returns True if none
+        """
+        ok = True
+        if duplicates := self.duplicates():
+            warning(f"!!! {self.branch} has several commits for steps {' '.join(duplicates)}"
+                    f" - using the most recent ones")
+            ok = False
+        if missing := self.missing(expected):
+            warning(f"!!! {self.branch} has no commit for steps {' '.join(missing)}")
+            ok = False
+        return ok
+
+
 def free_branchname(repo: Path, branch_name: str) -> str:
     """
     returns a free branch name
@@ -129,25 +363,46 @@ def free_branchname(repo: Path, branch_name: str) -> str:
 @click.group(chain=True, help=sys.modules[__name__].__doc__)
 @click.option("--debug", is_flag=True, help="enable debug output")
 @click.option("--quiet", is_flag=True, help="enable debug output")
-def cli(debug, quiet):
+@click.option("--timings", 'with_timings', is_flag=True, help="print on stderr where the time goes")
+@click.option("--timings-trace", type=Path, default=None, help="also save the detailed timings in this JSON file")
+def cli(debug, quiet, with_timings, timings_trace):
     if debug:
         logging.getLogger().setLevel(logging.DEBUG)
     if quiet:
         logging.getLogger().setLevel(logging.WARNING)
+    if with_timings or timings_trace:
+        timings.enable(timings_trace)
 
 
 # 0 means success and anything else means failure
 ShellSuccess = int
 
 
-@cli.command('togit', help="rebuild a git branch from a folder hierarchy")
-@click.option('-b', '--branch-name', type=str, default="steps", help="branch name to use - will search for a free one")
-@click.option('-i', '--input-steps-folder', type=Path, default=None, help="use a separate steps folder")
-@click.argument('repo', type=Path)
+def step_files(step_path: Path, only_git: bool) -> list[str]:
+    """
+    the files in a step folder, relative to that folder
+    with only_git, only the files known to git are considered
+    """
+    if only_git:
+        completed = shell(f"git -C {step_path} ls-files", capture_output=True)
+        files_list = completed.stdout.decode().splitlines()
+    else:
+        files_list = [
+            str(glob.relative_to(step_path)) for glob in step_path.glob("**/*")
+        ]
+    return [file for file in files_list if (step_path/file).is_file()]
 
-def togit(branch_name, input_steps_folder, repo: Path) -> ShellSuccess:
+
+def togit(repo: Path, *, branch_name: str = "steps",
+          input_steps_folder: Path | None = None,
+          fast_import: bool = True) -> ShellSuccess:
     """
     this rebuilds the git repository from a folder hierarchy
+
+    with fast_import set (the default) the whole branch is streamed into a
+    single git fast-import process, reading the files directly from the
+    step folders; otherwise we use the historical approach, that copies
+    each step in the working tree, then runs git add / commit / rm
     """
     # by default the folder hierarchy is expected to be in the .steps directory
     if input_steps_folder is None:
@@ -167,6 +422,20 @@ def togit(branch_name, input_steps_folder, repo: Path) -> ShellSuccess:
 
     input_steps_folder = input_steps_folder.absolute()
 
+    debug(f"globbing in {input_steps_folder}")
+    steps = sorted([ step_dir.relative_to(input_steps_folder) for step_dir in input_steps_folder.glob("[0-9]*") ])
+    debug(f"found {len(steps)} step directories")
+    with timings.phase('messages'):
+        messages = retrieve_messages(repo, input_steps_folder, steps)
+
+    with timings.phase('commits'):
+        if fast_import:
+            return togit_fast_import(repo, branch_name, input_steps_folder, steps, messages, only_git)
+        return togit_legacy(repo, branch_name, input_steps_folder, steps, messages, only_git)
+
+
+def togit_legacy(repo, branch_name, input_steps_folder, steps, messages, only_git) -> ShellSuccess:
+
     chdir(repo)
     repo = Path(".")
     info(f"working in {repo.absolute()}")
@@ -180,23 +449,11 @@ def togit(branch_name, input_steps_folder, repo: Path) -> ShellSuccess:
         info(f"Creating git repository in {repo}")
         shell(f"git init --initial-branch={branch_name}")
 
-    debug(f"globbing in {input_steps_folder}")
-    steps = sorted([ step_dir.relative_to(input_steps_folder) for step_dir in input_steps_folder.glob("[0-9]*") ])
-    debug(f"found {len(steps)} step directories")
-
     for step in steps:
         step_path = input_steps_folder / step
         info(f"Processing {step}")
         # gather all files in the directory
-        if only_git:
-            completed = shell(f"git -C {step_path} ls-files", capture_output=True)
-            files_list = completed.stdout.decode().splitlines()
-        else:
-            files_list = [
-                glob.relative_to(step_path) for glob in step_path.glob("**/*")
-            ]
-
-        files_list = [file for file in files_list if (step_path/file).is_file()]
+        files_list = step_files(step_path, only_git)
         files_str = " ".join(str(file) for file in files_list)
         info(f"found {len(list(files_list))} files")
         for file in files_list:
@@ -207,13 +464,7 @@ def togit(branch_name, input_steps_folder, repo: Path) -> ShellSuccess:
         debug(f"{step=} {step_path=} {files_str=}")
         completed = shell( f"tar -C {step_path} -cf - {files_str} | tar -C {repo.absolute()} -xf -")
         # message = strip_docstring(Path("main.py"))
-        message = ""
-        if not message:
-            _, message = retrieve_message_from_step_md(repo)
-        if not message:
-            readme_step, message = retrieve_message_from_commit(repo, step, 'main')
-            if readme_step != step:
-                warning(f"!!! {step} does not match {readme_step} - using {message}")
+        message = messages[step]
         # save message for next time
         # in repo this time
         step_md = Path("step.md")
@@ -241,22 +492,233 @@ def togit(branch_name, input_steps_folder, repo: Path) -> ShellSuccess:
     return 0
 
 
+def fast_import_path(path: str) -> str:
+    """
+    paths that start with a double quote or contain a newline must be quoted
+    """
+    if not path.startswith('"') and "\n" not in path:
+        return path
+    escaped = path.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return f'"{escaped}"'
+
+
+def togit_fast_import(repo, branch_name, input_steps_folder, steps, messages, only_git) -> ShellSuccess:
+    """
+    each step becomes a commit made of a deleteall, and one M line per file
+    each file is sent once as a blob - files that share an inode,
+    e.g. in hardlinked steps, or that did not change, are sent only once
+    """
+    if (repo / ".git").is_dir():
+        info(f"{repo} already a git repository.")
+        branch_name = free_branchname(repo, branch_name)
+        info(f"using branch {branch_name}")
+        created = False
+    else:
+        info(f"Creating git repository in {repo}")
+        shell(f"git init --initial-branch={branch_name} {repo}")
+        created = True
+    author = shell_capture(f"git -C {repo} var GIT_AUTHOR_IDENT")
+    committer = shell_capture(f"git -C {repo} var GIT_COMMITTER_IDENT")
+    if not (author and committer):
+        error(f"cannot figure out the git identity in {repo}")
+        return 1
+
+    process = timings.popen(['git', '-C', str(repo), 'fast-import', '--quiet'],
+                            stdin=sp.PIPE)
+    stream = process.stdin
+    # (device, inode, size, mtime) -> mark
+    marks = {}
+
+    def data(payload: bytes):
+        stream.write(f"data {len(payload)}\n".encode())
+        stream.write(timings.written(payload))
+        stream.write(b"\n")
+
+    def blob(path: Path, stat) -> int:
+        key = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        if key not in marks:
+            marks[key] = len(marks) + 1
+            stream.write(f"blob\nmark :{marks[key]}\n".encode())
+            if S_ISLNK(stat.st_mode):
+                data(os.fsencode(os.readlink(path)))
+            else:
+                data(timings.read(path.read_bytes()))
+        return marks[key]
+
+    for step in steps:
+        step_path = input_steps_folder / step
+        info(f"Processing {step}")
+        files_list = step_files(step_path, only_git)
+        info(f"found {len(files_list)} files")
+        message = messages[step]
+        modifies = []
+        for file in files_list:
+            # step.md is rewritten from the message, like in the legacy mode
+            if file == "step.md":
+                continue
+            path = step_path / file
+            stat = path.lstat()
+            if S_ISLNK(stat.st_mode):
+                mode = "120000"
+            elif stat.st_mode & 0o100:
+                mode = "100755"
+            else:
+                mode = "100644"
+            mark = blob(path, stat)
+            modifies.append(f"M {mode} :{mark} {fast_import_path(file)}\n")
+        stream.write(f"commit refs/heads/{branch_name}\n".encode())
+        stream.write(f"author {author}\ncommitter {committer}\n".encode())
+        data(f"step {step} - {message}\n".encode())
+        stream.write(b"deleteall\n")
+        stream.write("".join(modifies).encode())
+        stream.write(b"M 100644 inline step.md\n")
+        data(f"# {message}\n".encode())
+        stream.write(b"\n")
+    stream.close()
+    if process.wait() != 0:
+        error(f"git fast-import failed in {repo}")
+        return 1
+
+    # like in the legacy mode, end up on the new branch
+    if created:
+        shell(f"git -C {repo} reset -q --hard")
+    else:
+        shell(f"git -C {repo} switch -q {branch_name}")
+    # display current branches as we have switched to the new one
+    shell(f"git -C {repo} branch")
+    return 0
+
+
+@cli.command('togit', help="rebuild a git branch from a folder hierarchy")
+@click.option('-b', '--branch-name', type=str, default="steps", help="branch name to use - will search for a free one")
+@click.option('-i', '--input-steps-folder', type=Path, default=None, help="use a separate steps folder")
+@click.option('--fast-import/--no-fast-import', default=True, help="build the branch through a single git fast-import process (the default), or with git add and git commit in the working tree")
+@click.argument('repo', type=Path)
+def togit_cli(branch_name, input_steps_folder, fast_import, repo: Path) -> ShellSuccess:
+    """
+    this rebuilds the git repository from a folder hierarchy
+    """
+    return togit(repo, branch_name=branch_name,
+                 input_steps_folder=input_steps_folder, fast_import=fast_import)
+
+
 
-def tofolders(git_repo: Path, output_root: Path) -> list[Path]:
+def tofolders(git_repo: Path, output_root: Path, *,
+              batch: bool = True, incremental: bool = False,
+              hardlink: bool = False) -> list[Path]:
     """
     given a git repo, will extract all suitable commits under the .steps folder
     this directory gets first deleted/re-created
+
+    with batch set (the default) the whole history is read in one git log,
+    and the contents are streamed through a single git cat-file process;
+    otherwise we use the historical approach with several git commands
+    and a git archive for each commit
+
+    with incremental set, the directory is not deleted; instead the folders
+    whose commit tree has not changed since the previous run - as per the
+    manifest - are left untouched, only new or changed steps are extracted,
+    and the folders of the steps that are gone are removed
+
+    with hardlink set, the files are stored once in a content-addressed
+    store in .steps/.blobs, and the step folders are made of hardlinks
     """
     if not (git_repo.exists() and git_repo.is_dir() and (git_repo / '.git').is_dir()):
         warning(f"!!! {git_repo} is not a valid directory")
         return None
-    if output_root.is_dir():
-        warning(f"!!! {output_root} already exists, deleting it")
-        shell(f"rm -rf {output_root}")
-    elif output_root.exists():
+    if output_root.exists() and not output_root.is_dir():
         warning(f"!!! {output_root} is not a directory")
         return None
-    shell(f"mkdir {output_root}")
+    if (incremental or hardlink) and not batch:
+        warning(f"incremental and hardlink modes require the batch mode - using it")
+        batch = True
+    if output_root.is_dir() and not incremental:
+        warning(f"!!! {output_root} already exists, deleting it")
+        shell(f"rm -rf {output_root}")
+    if not output_root.is_dir():
+        shell(f"mkdir {output_root}")
+
+    # report duplicate or missing step ids up front
+    index = StepIndex(git_repo)
+    index.check()
+    with timings.phase('extract'):
+        if batch:
+            return populate_batch(index, output_root, hardlink)
+        return populate_legacy(git_repo, output_root)
+
+
+def write_step_md(folder: Path, message: str):
+    """
+    create step.md from the commit message, unless the commit has one already
+    """
+    step_md = folder / "step.md"
+    if not step_md.exists():
+        with step_md.open('w') as f:
+            f.write(f"# {message}\n")
+
+
+def load_manifest(output_root: Path) -> dict:
+    manifest = output_root / MANIFEST
+    if not manifest.exists():
+        return {}
+    try:
+        return json.loads(manifest.read_text())
+    except json.JSONDecodeError:
+        warning(f"!!! ignoring broken {manifest}")
+        return {}
+
+
+def save_manifest(output_root: Path, steps: dict):
+    manifest = output_root / MANIFEST
+    temporary = manifest.with_suffix('.tmp')
+    temporary.write_text(json.dumps(steps, indent=2) + "\n")
+    temporary.replace(manifest)
+
+
+def populate_batch(index: StepIndex, output_root: Path, hardlink: bool = False) -> list[Path]:
+    """
+    the folders that match the manifest are kept as-is
+    """
+    git_repo = index.git_repo
+    previous = load_manifest(output_root)
+    current = {}
+    folders = []
+    store = BlobStore(output_root / BLOBS) if hardlink else None
+    with GitObjects(git_repo) as objects:
+        for commit, tree, step, message in index.by_step.values():
+            folder = output_root / step
+            folders.append(folder)
+            entry = {'commit': commit, 'tree': tree, 'message': message,
+                     'hardlink': hardlink}
+            current[step] = entry
+            known = previous.get(step, {})
+            if (folder.is_dir() and known.get('tree') == tree
+                    and known.get('message') == message
+                    and known.get('hardlink', False) == hardlink):
+                debug(f"keeping {folder.name}")
+                continue
+            if folder.exists():
+                shutil.rmtree(folder)
+            folder.mkdir()
+            info(f"populating {folder.name}")
+            objects.extract(tree, folder, store)
+            write_step_md(folder, message)
+    # remove the folders of the steps that are gone
+    for folder in output_root.iterdir():
+        if folder.name.startswith('.') or folder.name in current:
+            continue
+        info(f"removing {folder.name}")
+        if folder.is_dir():
+            shutil.rmtree(folder)
+        else:
+            folder.unlink()
+    if (output_root / BLOBS).is_dir():
+        BlobStore(output_root / BLOBS).collect()
+    save_manifest(output_root, current)
+    return folders
+
+
+def populate_legacy(git_repo: Path, output_root: Path) -> list[Path]:
 
     def git_shell(git_command):
         command = f"git -C {git_repo} {git_command}"
@@ -276,10 +738,7 @@ def tofolders(git_repo: Path, output_root: Path) -> list[Path]:
             info(f"populating {folder.name}")
             command = f"git -C {git_repo} archive {commit} | tar -C {folder} -xf -"
             shell(command)
-            step_md = folder / "step.md"
-            if not step_md.exists():
-                with step_md.open('w') as f:
-                    f.write(f"# {message}\n")
+            write_step_md(folder, message)
         parent = git_shell(f"log --pretty='%p' -n 1 {commit}")
         if not parent or parent == commit:
             break
@@ -291,14 +750,18 @@ def tofolders(git_repo: Path, output_root: Path) -> list[Path]:
 @cli.command('tofolders',
              help="create a folder hierarchy from a git repository - it creates a fresh history as the provided branch")
 @click.option('-o', '--output-folder', type=Path, default=Path("--none--"), help="output folder, defaults to .steps")
+@click.option('--batch/--no-batch', default=True, help="read the repo through a single git cat-file process (the default), or with one git archive per commit")
+@click.option('-I', '--incremental', is_flag=True, help="keep the folders whose tree has not changed; note that local changes in these folders are kept as well")
+@click.option('-H', '--hardlink', is_flag=True, help="store each file once, and hardlink it in the step folders; the folders must then be treated as read-only")
 @click.argument('git_repo', type=Path)
-def tofolders_cli(output_folder, git_repo: Path) -> ShellSuccess:
+def tofolders_cli(output_folder, batch, incremental, hardlink, git_repo: Path) -> ShellSuccess:
     """
     this rebuilds the folder hierarchy from a git repository
     """
     if output_folder == Path("--none--"):
         output_folder = git_repo / ".steps"
-    folders = tofolders(git_repo, output_folder)
+    folders = tofolders(git_repo, output_folder, batch=batch,
+                        incremental=incremental, hardlink=hardlink)
     return 0 if folders else 1
 
 
@@ -319,32 +782,70 @@ def strip_docstring_cli(files: list[Path]) -> ShellSuccess:
 
 
 
+def diff_tree_batch(repo: Path, pairs: list[tuple[str, str]], mode: str = 'patch') -> list[str]:
+    """
+    diffs all the (commit1, commit2) pairs through a single git diff-tree
+    and returns the output for each pair
+
+    mode is one of 'patch', 'stat' or 'name-only'
+    diff-tree reads each input line as '<commit> <parent>', and echoes
+    the commit before its output; so we send '<commit2> <commit1>', and
+    the commits in pairs[i][1] are expected to be distinct
+    """
+    if not pairs:
+        return []
+    option = {'patch': '-p', 'stat': '--stat', 'name-only': '--name-only'}[mode]
+    command = ['git', '-C', str(repo), 'diff-tree', '--stdin', '-r', '-M', option]
+    debug(f"running command: {' '.join(command)}")
+    completed = timings.run(command, capture_output=True,
+                            input="".join(f"{h2} {h1}\n" for h1, h2 in pairs).encode())
+    if completed.returncode != 0:
+        error(completed.stderr.decode())
+    outputs = [[] for _ in pairs]
+    index = -1
+    for line in completed.stdout.decode().splitlines(keepends=True):
+        # the header for the next pair
+        if index + 1 < len(pairs) and line.rstrip("\n") == pairs[index + 1][1]:
+            index += 1
+            continue
+        if index >= 0:
+            outputs[index].append(line)
+    return ["".join(output) for output in outputs]
+
+
 @cli.command('diff-branches', help="compare two branches")
+@click.option('--stat', 'mode', flag_value='stat', help="show a diffstat instead of the patches")
+@click.option('--name-only', 'mode', flag_value='name-only', help="show only the names of the changed files")
 @click.argument('repo', type=Path)
 @click.argument('branch1', type=str)
 @click.argument('branch2', type=str)
-def diff_branches(repo: Path, branch1: str, branch2: str) -> ShellSuccess:
+def diff_branches(mode, repo: Path, branch1: str, branch2: str) -> ShellSuccess:
     """
     this compares two branches
+
+    steps are aligned on their step id, and the ones that have the same
+    tree in both branches are skipped; all the other pairs are diffed
+    through a single git diff-tree process
     """
-    chdir(repo)
-    repo = Path(".")
+    mode = mode or 'patch'
     info(f"working in {repo.absolute()}")
 
     def scan_branch(branch: str):
-        command = f"git log --pretty='%h %s' {branch}"
-        completed = shell(command, capture_output=True)
-        lines = completed.stdout.decode().split("\n")
-        d = {}
-        for line in lines:
-            if match := HASH_COMMIT_MATCHER.match(line):
-                hash = match.group("hash")
-                step = match.group("step")
-                message = match.group("message")
-                d[step] = (hash, message)
+        index = StepIndex(repo, branch)
+        index.check()
+        d = {step: (commit, tree, message)
+             for commit, tree, step, message in index.by_step.values()}
         debug(d)
         return d
 
+    def header(step, side1, side2):
+        info(40*'-')
+        for branch, side in ((branch1, side1), (branch2, side2)):
+            if side is None:
+                info(f"{branch}: {step} - (missing)")
+            else:
+                commit, _, message = side
+                info(f"{commit[:7]}: {step} - {message}")
 
     d1, d2 = scan_branch(branch1), scan_branch(branch2)
     if len(d1) != len(d2):
@@ -354,23 +855,28 @@ def diff_branches(repo: Path, branch1: str, branch2: str) -> ShellSuccess:
         info(f"{d1.keys()=}")
         info(f"{d2.keys()=}")
 
-    for (s1, (h1, m1)), (s2, (h2, m2)) in zip(d1.items(), d2.items()):
-        has_changes = False
-        if s1 != s2 or m1 != m2:
-            has_changes = True
-        command = f"git diff {h1} {h2}"
-        output = shell(command, capture_output=True)
-        if output.stdout:
-            has_changes = True
-        if has_changes:
-            info(40*'-')
-            info(f"{h1}: {s1} - {m1}")
-            info(f"{h2}: {s2} - {m2}")
-            info(command)
-            print(output.stdout.decode())
-            # for smooth mixing with stderr where the context 
+    steps = sorted(d1.keys() | d2.keys())
+    # the steps present on both sides with different trees
+    to_diff = [step for step in steps
+               if step in d1 and step in d2 and d1[step][1] != d2[step][1]]
+    pairs = [(d1[step][0], d2[step][0]) for step in to_diff]
+    with timings.phase('diff-tree'):
+        outputs = dict(zip(to_diff, diff_tree_batch(repo, pairs, mode)))
+
+    for step in steps:
+        side1, side2 = d1.get(step), d2.get(step)
+        if side1 is None or side2 is None:
+            header(step, side1, side2)
+        elif step in outputs:
+            header(step, side1, side2)
+            print(outputs[step])
+            # for smooth mixing with stderr where the context
             # (step, file, ..) is printed
             sys.stdout.flush()
+        elif side1[2] != side2[2]:
+            header(step, side1, side2)
+            info("same tree, the messages differ")
+    return 0
 
 
 if __name__ == '__main__':
@@ -10,12 +10,17 @@ for each step it compares the files (under git) in the two folders
 and produces a diff-like markdown fragment for each file
 """
 
+import os
 import sys
-import difflib
-from pathlib import Path
+import io
+import hashlib
+import json
+import time
+from pathlib import Path, PurePosixPath
 from argparse import ArgumentParser
-import subprocess as sp
 from dataclasses import dataclass
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor
 
 import logging
 logger = logging.getLogger('steps')
@@ -25,8 +30,11 @@ logging.basicConfig(level=logging.INFO)
 
 import click
 
-# when generating for scrolly coding, the output syntax is a little different
-SCROLLY = False
+import steps
+from diffengines import DIFF_ENGINES
+import fillauto
+import timings
+
 # by default, we add a (sub)step for each file that is new or that has a change
 # with this set to True, we only add a step if the change is described in a -step.md
 ONLY_CHANGES_WITH_STEP = False
@@ -109,20 +117,229 @@ class DiffWriter:
         self.mode = mode
 
 
-    def flush(self):
-        # write annotations
+    def text(self):
+        """
+        the annotations, then the body, as a single string
+        """
+        lines = []
         for annotation in self.annotations:
             mode = annotation.mode
             match mode:
                 case '+' | '-':
-                    print(self.comment(f"!diff({annotation.start}:{annotation.end}) {mode}"))
+                    lines.append(self.comment(f"!diff({annotation.start}:{annotation.end}) {mode}"))
                 case '@':
-                    print(self.comment(f"!className({annotation.start}) separator"))
-        for line in self.lines:
-            print(line)
+                    lines.append(self.comment(f"!className({annotation.start}) separator"))
+        lines.extend(self.lines)
+        return "".join(f"{line}\n" for line in lines)
+
+    def flush(self, out=None):
+        (out or sys.stdout).write(self.text())
+
+
+@dataclass
+class FileChange:
+    """
+    the outcome of comparing one file between two steps
+    """
+    kind: str                           # 'changed', 'new' or 'deleted'
+    file: str                           # as listed in the folder, e.g. ./app.py
+    step_md: list[str] | None = None    # the lines in <file>-step.md, if present
+    lang: str = ''
+    filename: str = ''
+    diff_writer: DiffWriter | None = None
+
+
+@dataclass
+class DirDiff:
+    """
+    the outcome of comparing two step folders
+    this is computed once, and can then be rendered in several layouts
+    """
+    d1: str
+    d2: str
+    dir_readme: str
+    changes: list[FileChange]
+
+
+# the single column and the scrollycoding layouts only differ in a few details
+# that are isolated in the Renderer subclasses
+class Renderer:
+
+    name = None
+
+    def fence(self, lang, filename):
+        raise NotImplementedError
+
+    def step_heading(self, d2, locator, dir_readme):
+        """
+        the line that starts a new step, or None
+        """
+        raise NotImplementedError
+
+    def item_open(self, topic, label, tooltip):
+        """
+        the line that opens a change, or None
+        """
+        raise NotImplementedError
+
+    def item_close(self):
+        """
+        the line that closes a change, or None
+        """
+        raise NotImplementedError
+
+    # the rendering methods return strings, that the callers write in one go
+    def code_block(self, lang, filename, diff_writer):
+        return f"{self.fence(lang, filename)}\n{diff_writer.text()}```\n\n"
+
+    def file_step(self, change, d1, d2, dir_readme, nth, total):
+        """
+        the contents of <file>-step.md, with its first line turned into headings
+        """
+        first, *rest = change.step_md
+        if first.startswith('## '):
+            title = first[3:].strip()
+        else:
+            title = f"!!! MISSING TITLE in {d2}/{Path(change.file).name} !!!"
+        locator = f" ({nth}/{total})" if total != 1 else ""
+        pieces = []
+        if (heading := self.step_heading(d2, locator, dir_readme)) is not None:
+            pieces.append(f"{heading}\n")
+        name = Path(change.file).name
+        if change.kind == 'changed':
+            pieces.append(f"### {d1} -> {d2} - changes in {name}\n")
+        else:
+            pieces.append(f"### {d2} : new file {name}\n")
+        pieces.append(f"#### {title}\n")
+        pieces.extend(rest)
+        if not change.step_md[-1].endswith('\n'):
+            pieces.append("\n")
+        return "".join(pieces)
+
+    def fragments(self, dir_diff):
+        """
+        a generator of the fragments for each file change
+        """
+        d1, d2, dir_readme = dir_diff.d1, dir_diff.d2, dir_diff.dir_readme
+        total = len(dir_diff.changes)
+        for nth, change in enumerate(dir_diff.changes, 1):
+            if change.kind == 'deleted':
+                yield f"## {nth}/{total} deleted in {d2}: {change.file}\n"
+                continue
+            pieces = []
+            nth_verbose = f" - {nth}/{total}" if total != 1 else " - "
+            topic = f"step {d2}{nth_verbose} {dir_readme}"
+            label = f"{d2} {dir_readme}" if nth == 1 else f"{d2}{nth_verbose}"
+            what = "changes in" if change.kind == 'changed' else "new file"
+            if (line := self.item_open(topic, label, f"{what} {change.file}")) is not None:
+                pieces.append(f"{line}\n")
+            if change.step_md is not None:
+                pieces.append(self.file_step(change, d1, d2, dir_readme, nth, total))
+            pieces.append(self.code_block(change.lang, change.filename, change.diff_writer))
+            if (line := self.item_close()) is not None:
+                pieces.append(f"{line}\n")
+            yield "".join(pieces)
+
+    def dir_diff(self, dir_diff):
+        return "".join(self.fragments(dir_diff))
+
+
+class SingleColumnRenderer(Renderer):
+    """
+    each change is wrapped in a TableOfContentsItem
+    """
+
+    name = 'single'
+
+    def fence(self, lang, filename):
+        return f"```{lang} {filename}"
+
+    def step_heading(self, d2, locator, dir_readme):
+        # the headers has been inserted already as a TableOfContentsItem
+        return None
+
+    def item_open(self, topic, label, tooltip):
+        return f"<TableOfContentsItem topic='{topic}' label='{label}' tooltip='{tooltip}'>"
+
+    def item_close(self):
+        return "</TableOfContentsItem>"
+
+
+class ScrollyRenderer(Renderer):
+    """
+    each change becomes a !!steps block
+    """
+
+    name = 'scrolly'
+
+    def fence(self, lang, filename):
+        return f"```{lang} ! {filename}"
+
+    def step_heading(self, d2, locator, dir_readme):
+        return f"## !!steps {d2}{locator}: {dir_readme}"
+
+    def item_open(self, topic, label, tooltip):
+        return None
+
+    def item_close(self):
+        return None
+
+
+class ShardRenderer(SingleColumnRenderer):
+    """
+    like single column, but for the sharded output: the TableOfContentsItem
+    that wraps each step is in the index, so that it is there before
+    the step gets loaded
+    """
+
+    name = 'shard'
+
+    def item_open(self, topic, label, tooltip):
+        return None
+
+    def item_close(self):
+        return None
+
+
+RENDERERS = {renderer.name: renderer
+             for renderer in (SingleColumnRenderer(), ScrollyRenderer(), ShardRenderer())}
+
+
+def cat_lines(lines, comment, added=True):
+    """
+    a DiffWriter where all lines are marked as added (or removed)
+    """
+    sign = '+' if added else '-'
+    diff_writer = DiffWriter(comment)
+    for line in lines:
+        diff_writer.add_line(line, sign)
+    return diff_writer
+
+
+def diff_lines(lines1, lines2, comment, fromfile='', tofile='', engine='difflib'):
+    """
+    a DiffWriter that describes the changes from lines1 to lines2
+    engine is the name of a diff engine, see diffengines.py
+    """
+    diff_writer = DiffWriter(comment)
+    diff_engine = DIFF_ENGINES[engine]
+    for line in diff_engine.unified(lines1, lines2, fromfile, tofile):
+        if line.startswith('---') or line.startswith('+++') or not line.strip():
+            continue
+        if line.startswith('@@'):
+            diff_writer.add_line(line, '@')
+            continue
+        start, end = line[:1], line[1:]
+        if start == ' ':
+            diff_writer.add_line(line[1:], ' ')
+            continue
+        if start in ['-', '+']:
+            diff_writer.add_line(end, start)
+    return diff_writer
 
 
-def onefile_cat(file1, *, filename=None, lang=None, comment=None, added=True):
+def onefile_cat(file1, *, filename=None, lang=None, comment=None, added=True,
+                renderer=None, out=None):
     """
     Print the contents of a file as a triple-fenced code block.
     if added is True, print the added lines with a green + sign
@@ -134,22 +351,14 @@ def onefile_cat(file1, *, filename=None, lang=None, comment=None, added=True):
         return
     # assign from args or compute defaults
     filename, lang, comment = defaults(path1, filename, lang, comment)
-    sign = '+' if added else '-'
-    diff_writer = DiffWriter(comment)
-    if not SCROLLY:
-        print(f"```{lang} {filename}")
-    else:
-        print(f"```{lang} ! {filename}")
     with path1.open() as f:
-        for line in f:
-            line = line.rstrip()
-            diff_writer.add_line(line, sign)
-    diff_writer.flush()
-    print("```")
-    print()
+        diff_writer = cat_lines((line.rstrip() for line in f), comment, added)
+    renderer = renderer or RENDERERS['single']
+    (out or sys.stdout).write(renderer.code_block(lang, filename, diff_writer))
 
 
-def onefile_diff(file1, file2, *, filename=None, lang=None, comment=None):
+def onefile_diff(file1, file2, *, filename=None, lang=None, comment=None,
+                 renderer=None, out=None, engine='difflib'):
     """
     Compare two files and print the differences as one triple-fenced code block.
     """
@@ -162,71 +371,314 @@ def onefile_diff(file1, file2, *, filename=None, lang=None, comment=None):
     filename, lang, comment = defaults(path1, filename, lang, comment)
 
     lines1, lines2 = path1.read_text().splitlines(), path2.read_text().splitlines()
-    if not SCROLLY:
-        print(f"```{lang} {filename}")
-    else:
-        print(f"```{lang} ! {filename}")
-    diff_writer = DiffWriter(comment)
-    for line in difflib.unified_diff(lines1, lines2, str(file1), str(file2)):
-        if line.startswith('---') or line.startswith('+++') or not line.strip():
-            continue
-        if line.startswith('@@'):
-            diff_writer.add_line(line, '@')
-            continue
-        start, end = line[:1], line[1:]
-        if start == ' ':
-            diff_writer.add_line(line[1:], ' ')
-            continue
-        if start in ['-', '+']:
-            diff_writer.add_line(end, start)
-    diff_writer.flush()
-    print("```")
-    print()
+    diff_writer = diff_lines(lines1, lines2, comment, str(file1), str(file2), engine)
+    renderer = renderer or RENDERERS['single']
+    (out or sys.stdout).write(renderer.code_block(lang, filename, diff_writer))
 
 
-def files_equal(file1, file2):
+def scan_folder(path):
     """
-    Check if two files are equal.
+    all the regular files in a folder, as a dict ./relative/path -> os.stat_result
+    i.e. what `find . -type f` would list, but without a subprocess
     """
-    path1, path2 = Path(file1), Path(file2)
-    if not path1.exists() or not path2.exists():
-        return False
-    return path1.read_text() == path2.read_text()
+    found = {}
+    def scan(folder, prefix):
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    scan(entry.path, f"{prefix}{entry.name}/")
+                elif entry.is_file(follow_symlinks=False):
+                    found[f"{prefix}{entry.name}"] = entry.stat(follow_symlinks=False)
+    scan(path, "./")
+    return found
 
 
-def onedir_diff(dir1, dir2, only_git):
+def list_files(path, only_git):
     """
-    compare two folders
-    - files that appear in both: use onefile_diff
-    - new files i.e. that appear in dir2 but not dir1:
-      print a simple code block with the new one
-    - deleted files: just mention them as deleted
+    the sorted list of files in a folder
+    if only_git is set, consider only files under git
     """
-    path1, path2 = Path(dir1), Path(dir2)
-    for path in [path1, path2]:
-        if not path.exists():
-            error(f"Directory {path} does not exist.")
-            return
-    d1, d2 = path1.name, path2.name
-    # consider only files under git
     if only_git:
-        sp1 = sp.run(['git', 'ls-files'], cwd=path1, capture_output=True)
-        sp2 = sp.run(['git', 'ls-files'], cwd=path2, capture_output=True)
-    else:
-        sp1 = sp.run(['find', '.', '-type', 'f'], cwd=path1, capture_output=True)
-        sp2 = sp.run(['find', '.', '-type', 'f'], cwd=path2, capture_output=True)
-    files1 = sorted(set(sp1.stdout.decode().splitlines()))
-    files2 = sorted(set(sp2.stdout.decode().splitlines()))
-
-    global_step = dir2 / "step.md"
-    if not global_step.exists():
-        warning(f"File {global_step} does not exist!")
-        dir_readme = "no dir readme !"
-    else:
-        with global_step.open() as f:
-            # should contain '# the step readme'
-            dir_readme = f.readline().strip()[2:]
-            dir_readme = dir_readme.replace('<', '&lt;').replace('>', '&gt;')
+        completed = timings.run(['git', 'ls-files'], cwd=path, capture_output=True)
+        return sorted(set(completed.stdout.decode().splitlines()))
+    return sorted(scan_folder(path))
+
+
+# the contents of a step can come from a folder, or straight from a git commit
+# so compute_dir_diff deals with StepTree objects, that expose the files
+# by their name as listed, e.g. ./app.py with `find` or app.py with `git ls-files`
+class StepTree:
+
+    name = None
+
+    def exists(self):
+        return True
+
+    @staticmethod
+    def normalize(file):
+        return file if file.startswith("./") else f"./{file}"
+
+    def files(self):
+        raise NotImplementedError
+
+    def has(self, file):
+        raise NotImplementedError
+
+    def read_bytes(self, file):
+        raise NotImplementedError
+
+    def read_text(self, file):
+        # like Path.read_text, i.e. with the default encoding and universal newlines
+        return io.TextIOWrapper(io.BytesIO(self.read_bytes(file))).read()
+
+    def same_file(self, file, other):
+        """
+        whether file has the same contents in self and in other
+        """
+        return self.read_text(file) == other.read_text(file)
+
+    def location(self, file):
+        """
+        a human-readable location of file, for messages
+        """
+        raise NotImplementedError
+
+    def digest(self):
+        """
+        a hash of all the contents, for FragmentCache
+        """
+        raise NotImplementedError
+
+    def release(self):
+        """
+        forget the contents read so far, once the tree is no longer needed
+        """
+        self.data = {}
+
+
+# content hashes by (device, inode, size, mtime), so that the files that are
+# hardlinked across several steps get hashed only once
+INODE_HASHES = {}
+
+
+class FolderTree(StepTree):
+    """
+    a step stored in a folder, e.g. as created by steps.py tofolders
+
+    this acts as an index of the folder, built once and shared by the 2 pairs
+    where the folder appears: the files and their sizes come from a single scan,
+    each file is read at most once, and equality is checked on content hashes
+    - or on inodes in a hardlinked steps folder
+    """
+
+    def __init__(self, path, only_git):
+        self.path = Path(path)
+        self.name = self.path.name
+        self.only_git = only_git
+        # all computed on first use
+        self.stats = None
+        self.listing = None
+        self.hashes = {}
+        self.data = {}
+
+    def __getstate__(self):
+        # the contents are cheaper to read again than to send to a worker
+        return self.__dict__ | {'data': {}}
+
+    def __str__(self):
+        return str(self.path)
+
+    def exists(self):
+        return self.path.exists()
+
+    def scanned(self):
+        if self.stats is None:
+            self.stats = scan_folder(self.path) if self.path.is_dir() else {}
+        return self.stats
+
+    def files(self):
+        if self.listing is None:
+            self.listing = (list_files(self.path, self.only_git) if self.only_git
+                            else sorted(self.scanned()))
+        return self.listing
+
+    def has(self, file):
+        return self.normalize(file) in self.scanned()
+
+    def read_bytes(self, file):
+        file = self.normalize(file)
+        if file not in self.data:
+            self.data[file] = timings.read((self.path / file).read_bytes())
+        return self.data[file]
+
+    def hash(self, file):
+        file = self.normalize(file)
+        if file not in self.hashes:
+            stat = self.scanned()[file]
+            inode = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+            if inode not in INODE_HASHES:
+                INODE_HASHES[inode] = hashlib.sha256(self.read_bytes(file)).hexdigest()
+            self.hashes[file] = INODE_HASHES[inode]
+        return self.hashes[file]
+
+    def same_file(self, file, other):
+        if not isinstance(other, FolderTree):
+            return super().same_file(file, other)
+        stat1 = self.scanned().get(self.normalize(file))
+        stat2 = other.scanned().get(self.normalize(file))
+        if stat1 is None or stat2 is None:
+            return False
+        # in a hardlinked steps folder, identical files share the same inode
+        if (stat1.st_dev, stat1.st_ino) == (stat2.st_dev, stat2.st_ino):
+            return True
+        if stat1.st_size == stat2.st_size and self.hash(file) == other.hash(file):
+            return True
+        # different bytes may still be the same text, e.g. with other line endings
+        return self.read_text(file) == other.read_text(file)
+
+    def location(self, file):
+        return str(self.path / file)
+
+    def digest(self):
+        # all files, not just the ones under git, because the
+        # -step.md files are used regardless
+        hasher = hashlib.sha256()
+        for file in sorted(self.scanned()):
+            hasher.update(f"{file}\0{self.hash(file)}\0".encode())
+        if self.only_git:
+            hasher.update("\n".join(self.files()).encode())
+        return hasher.hexdigest()
+
+
+# one GitObjects process per repo, and per process
+# so that GitTree objects can be sent to worker processes
+GIT_OBJECTS = {}
+
+def git_objects(repo):
+    key = (str(repo), os.getpid())
+    if key not in GIT_OBJECTS:
+        GIT_OBJECTS[key] = steps.GitObjects(repo)
+    return GIT_OBJECTS[key]
+
+
+class GitTree(StepTree):
+    """
+    a step read straight from a commit, without materializing it in a folder
+    the files are listed like `find` does in the output of steps.py tofolders,
+    including the step.md file that tofolders creates when needed
+    """
+
+    def __init__(self, repo, tree, step, message):
+        self.repo = Path(repo)
+        self.tree = tree
+        self.name = step
+        self.message = message
+        # path -> blob hash, computed on first use
+        self.blobs = None
+        self.data = {}
+
+    def __str__(self):
+        return f"{self.repo}@{self.name}"
+
+    def entries(self):
+        if self.blobs is None:
+            self.blobs = {
+                f"./{path}": sha
+                for path, mode, sha in git_objects(self.repo).walk(self.tree)
+                # symlinks are not listed by find -type f
+                if mode != '120000'
+            }
+            if "./step.md" not in self.blobs:
+                self.blobs["./step.md"] = None
+        return self.blobs
+
+    def files(self):
+        return sorted(self.entries())
+
+    def has(self, file):
+        return self.normalize(file) in self.entries()
+
+    def read_bytes(self, file):
+        file = self.normalize(file)
+        if file not in self.data:
+            sha = self.entries()[file]
+            if sha is None:
+                self.data[file] = f"# {self.message}\n".encode()
+            else:
+                _, self.data[file] = git_objects(self.repo).read(sha)
+        return self.data[file]
+
+    def same_file(self, file, other):
+        if isinstance(other, GitTree):
+            sha1 = self.entries()[self.normalize(file)]
+            sha2 = other.entries()[self.normalize(file)]
+            if sha1 is not None and sha1 == sha2:
+                return True
+        return super().same_file(file, other)
+
+    def location(self, file):
+        return f"{self.repo}@{self.name}:{self.normalize(file)}"
+
+    def digest(self):
+        return hashlib.sha256(f"{self.tree}\n{self.message}".encode()).hexdigest()
+
+
+def git_trees(repo, branch="HEAD"):
+    """
+    the GitTree objects for the steps in a repo, older first
+    """
+    index = steps.StepIndex(repo, branch)
+    index.check()
+    return [
+        GitTree(repo, tree, step, message)
+        for commit, tree, step, message in index.by_step.values()
+    ]
+
+
+def read_file_step(tree, file):
+    """
+    the lines in the <file>-step.md companion of a file, or None
+    """
+    file_step = file + '-step.md'
+    if not tree.has(file_step):
+        warning(f"File {tree.location(file_step)} does not exist!")
+        warning(f"output likely broken !!!")
+        return None
+    lines = io.StringIO(tree.read_text(file_step)).readlines() or ['']
+    if not lines[0].startswith('## '):
+        warning(f"README file {tree.location(file_step)} does not start with ##")
+    return lines
+
+
+def step_readme(tree):
+    """
+    the one-liner in step.md, escaped for mdx
+    """
+    if not tree.has("step.md"):
+        warning(f"File {tree.location('step.md')} does not exist!")
+        return "no dir readme !"
+    # should contain '# the step readme'
+    dir_readme = tree.read_text("step.md").partition('\n')[0].strip()[2:]
+    return dir_readme.replace('<', '&lt;').replace('>', '&gt;')
+
+
+def compute_dir_diff(tree1, tree2, engine='difflib'):
+    """
+    compare two step trees
+    - files that appear in both: compute their diff, with that diff engine
+    - new files i.e. that appear in tree2 but not tree1:
+      all their lines are marked as added
+    - deleted files: just mention them as deleted
+    returns a DirDiff, or None if one of the trees is missing
+    """
+    for tree in [tree1, tree2]:
+        if not tree.exists():
+            error(f"Directory {tree} does not exist.")
+            return None
+    d1, d2 = tree1.name, tree2.name
+    files1, files2 = tree1.files(), tree2.files()
+
+    dir_readme = step_readme(tree2)
 
     # ignore step.md in the list of files
     files1 = [f for f in files1 if not f.lower().endswith('step.md')]
@@ -236,161 +688,553 @@ def onedir_diff(dir1, dir2, only_git):
 
     same_files =  sorted(set(files1) & set(files2))
     # discard files that are the same
-    same_files = [f for f in same_files if not files_equal(path1 / f, path2 / f)]
+    same_files = [f for f in same_files if not tree1.same_file(f, tree2)]
     new_files = sorted(set(files2) - set(files1))
     deleted_files = sorted(set(files1) - set(files2))
 
-    def handle_first_line(line, name, d1, d2, nth, total):
-        if not line.startswith('## '):
-            warning(f"README file {global_step} does not start with ##")
-            title = "!!! MISSING TITLE in {d2}/{name} !!!"
-        else:
-            title = line[3:].strip()
-            locator = f" ({nth}/{total})" if total != 1 else ""
-        if SCROLLY:
-            print(f"## !!steps {d2}{locator}: {dir_readme}")
-        else:
-            # the headers has been inserted already as a TableOfContentsItem
-            pass
-            # print(f"## step {d2}{locator}: {dir_readme}")
+    def has_step(file):
+        return tree2.has(file + '-step.md')
 
-        if d1:
-            print(f"### {d1} -> {d2} - changes in {name}")
-        else:
-            print(f"### {d2} : new file {name}")
+    if ONLY_CHANGES_WITH_STEP:
+        same_files = [f for f in same_files if has_step(f)]
+        new_files = [f for f in new_files if has_step(f)]
+        debug(f"same_files (kept only with -step.md): {same_files}")
+        debug(f"new_files (kept only with -step.md): {new_files}")
+
+    changes = []
+    # open the possibility to specify an order
+    for file in same_files:
+        info(f"changes in file: {file}")
+        filename, lang, comment = defaults(PurePosixPath(file), None, None, None)
+        lines1 = tree1.read_text(file).splitlines()
+        lines2 = tree2.read_text(file).splitlines()
+        with timings.timed('diff', file):
+            diff_writer = diff_lines(lines1, lines2, comment,
+                                     tree1.location(file), tree2.location(file), engine)
+        changes.append(FileChange(
+            'changed', file, read_file_step(tree2, file), lang, filename, diff_writer))
+    for file in new_files:
+        info(f"new file: {file}")
+        filename, lang, comment = defaults(PurePosixPath(file), None, None, None)
+        lines = (line.rstrip() for line in io.StringIO(tree2.read_text(file)))
+        changes.append(FileChange(
+            'new', file, read_file_step(tree2, file), lang, filename,
+            cat_lines(lines, comment, added=True)))
+    for file in deleted_files:
+        warning(f"deleted file : {file}")
+        changes.append(FileChange('deleted', file))
+    return DirDiff(d1, d2, dir_readme, changes)
+
+
+def onedir_diff(dir1, dir2, only_git, renderer=None, out=None, engine='difflib'):
+    """
+    compare two folders and print the outcome in the renderer's layout
+    """
+    dir_diff = compute_dir_diff(
+        FolderTree(dir1, only_git), FolderTree(dir2, only_git), engine)
+    if dir_diff is not None:
+        renderer = renderer or RENDERERS['single']
+        (out or sys.stdout).write(renderer.dir_diff(dir_diff))
+
+
+class FragmentCache:
+    """
+    a persistent on-disk cache for the fragments rendered by onedir_diff
+
+    each entry is stored in <folder>/<tag>.<key>.md
+    where tag describes the render mode, and key is a hash of both trees
+    and of the rendering code - see CODE_DIGEST
+    """
 
-        print(f"#### {title}")
+    # the source of the rendering code is part of the key, so that
+    # any change there invalidates the fragments rendered before it
+    CODE_DIGEST = hashlib.sha256(b"".join(
+        (Path(__file__).parent / module).read_bytes()
+        for module in ("stepstohike.py", "diffengines.py"))).hexdigest()
 
-    def has_step(path, *, new_dir):
-        return (path.parent / (path.name + '-step.md')).exists()
+    def __init__(self, folder, tag):
+        self.folder = Path(folder)
+        self.tag = tag
+        self.folder.mkdir(parents=True, exist_ok=True)
 
-    def handle_step(path, *, new_dir, nth, total=None, old_dir=None):
+    @staticmethod
+    def key(a, b, renderer, engine, digests):
         """
-        d1=None mean it's a new file in d2
+        digests is a dict tree name -> digest, so that each tree
+        gets scanned only once even though it appears in 2 pairs
         """
-        file_step = path.parent / (path.name + '-step.md')
-        if file_step.exists():
-            with file_step.open() as f:
-                for lineno, line in enumerate(f, 1):
-                    if lineno == 1:
-                        handle_first_line(line, path.name, old_dir, new_dir, nth, total)
-                    else:
-                        print(line, end="")
-                if not line.endswith('\n'):
-                    print()
-        else:
-            warning(f"File {file_step} does not exist!")
-            warning(f"output likely broken !!!")
-
-    def heading_details(file, nth, total):
-        nth_verbose = f" - {nth}/{total}" if total != 1 else " - "
-        topic = f"step {d2}{nth_verbose} {dir_readme}"
-        if nth == 1:
-            label = f"{d2} {dir_readme}"
-        else:
-            label = f"{d2}{nth_verbose}"
-        return topic, label
+        for tree in (a, b):
+            if tree.name not in digests:
+                digests[tree.name] = tree.digest()
+        only_git = getattr(b, 'only_git', False)
+        parts = [a.name, b.name, digests[a.name], digests[b.name],
+                 renderer.name, f"{ONLY_CHANGES_WITH_STEP=}", f"{only_git=}",
+                 f"{engine=}", FragmentCache.CODE_DIGEST]
+        return hashlib.sha256("\n".join(parts).encode()).hexdigest()
 
+    def entry(self, key):
+        return self.folder / f"{self.tag}.{key}.md"
 
-    # open the possibility to specify an order
-    def handle_same_file(file, nth, total):
-        info(f"changes in file: {file}")
-        topic, label = heading_details(file, nth, total)
-        if not SCROLLY:
-            print(f"<TableOfContentsItem topic='{topic}' label='{label}' tooltip='changes in {file}'>")
-        handle_step(path2 / file, old_dir=d1, new_dir=d2, nth=nth, total=total)
-        onefile_diff(path1 / file, path2 / file)
-        if not SCROLLY:
-            print(f"</TableOfContentsItem>")
+    def get(self, key):
+        entry = self.entry(key)
+        if not entry.exists():
+            return None
+        return timings.read(entry.read_text())
 
+    def put(self, key, fragment):
+        entry = self.entry(key)
+        # write in a temporary file first so that concurrent runs
+        # never see a partial entry
+        temporary = entry.with_suffix('.tmp')
+        temporary.write_text(timings.written(fragment))
+        temporary.replace(entry)
 
-    def handle_new_file(file, nth, total):
-        info(f"new file: {file}")
-        topic, label = heading_details(file, nth, total)
+    def evict(self, keys):
+        """
+        remove the entries of that tag that are not in keys
+        i.e. the ones that are stale, or that have no current step
+        """
+        keep = {self.entry(key).name for key in keys}
+        for entry in self.folder.glob(f"{self.tag}.*.md"):
+            if entry.name not in keep:
+                debug(f"evicting {entry.name}")
+                entry.unlink()
 
-        if not SCROLLY:
-            print(f"<TableOfContentsItem topic='{topic}' label='{label}' tooltip='new file {file}'>")
-        handle_step(path2 / file, new_dir=d2, nth=nth, total=total)
-        onefile_cat(path2 / file, added=True)
-        if not SCROLLY:
-            print(f"</TableOfContentsItem>")
 
-    if ONLY_CHANGES_WITH_STEP:
-        same_files = [f for f in same_files if has_step(path2 / f, new_dir=d2)]
-        new_files = [f for f in new_files if has_step(path2 / f, new_dir=d2)]
-        debug(f"same_files (kept only with -step.md): {same_files}")
-        debug(f"new_files (kept only with -step.md): {new_files}")
+def render_pair(a, b, renderers, only_changes_with_step, engine):
+    """
+    compare one pair of trees, and render the outcome with each renderer
+    returns a dict renderer name -> fragment
+    this is what runs in the worker processes, so the global setting
+    is passed explicitly
+    """
+    global ONLY_CHANGES_WITH_STEP
+    ONLY_CHANGES_WITH_STEP = only_changes_with_step
+    with timings.timed('pair', f"{a.name} -> {b.name}"):
+        dir_diff = compute_dir_diff(a, b, engine)
+        return {
+            renderer.name: renderer.dir_diff(dir_diff) if dir_diff is not None else ""
+            for renderer in renderers
+        }
 
-    total_changes = len(same_files) + len(new_files) + len(deleted_files)
 
-    nth = 1
-    for file in same_files:
-        handle_same_file(file, nth, total_changes)
-        nth += 1
-    for file2 in new_files:
-        handle_new_file(file2, nth, total_changes)
-        nth += 1
+def init_worker(level):
+    """
+    the initializer of the worker processes; being defined here, it gets
+    called once this module is imported in the worker - and with the spawn
+    start method, that import runs logging.basicConfig again
+    """
+    logging.getLogger().setLevel(level)
 
-    for file1 in deleted_files:
-        warning(f"deleted file : {file1}")
-        print(f"## {nth}/{total_changes} deleted in {d2}: {file1}")
-        nth += 1
 
-def chaindirs(paths, only_git):
+def iter_fragments(trees, renderer, *, per_file=False, engine='difflib'):
+    """
+    the library counterpart of chaindirs: a generator that yields
+    (step name, fragment) tuples, one per step pair - or one per file
+    with per_file set - without going through stdout
     """
-    accepts a sequence of at least 2 paths
-    then will run onefile_diff on each pair of successive paths
+    for a, b in zip(trees, trees[1:]):
+        dir_diff = compute_dir_diff(a, b, engine)
+        a.release()
+        if dir_diff is None:
+            continue
+        if per_file:
+            for fragment in renderer.fragments(dir_diff):
+                yield b.name, fragment
+        else:
+            yield b.name, renderer.dir_diff(dir_diff)
+
+
+def chaindirs(trees, targets, jobs=1, cache_dir=None, engine='difflib'):
+    """
+    accepts a sequence of at least 2 StepTree objects
+    then will compare each pair of successive trees
+
+    targets is a list of (renderer, out) tuples; the diffs are computed
+    only once, and rendered in each layout into the corresponding out
+
+    with jobs > 1 the pairs are rendered in a pool of processes,
+    and the fragments are written back in the original order
+    so the output is the same as with the serial run
+
+    with a cache_dir, only the pairs whose contents have changed
+    since the previous run get rendered again
+
+    engine is the name of the diff engine, see diffengines.py
     """
-    for a, b in zip(paths, paths[1:]):
-        info(f"==== comparing {a.name} and {b.name}")
-        onedir_diff(a, b, only_git)
+    pairs = list(zip(trees, trees[1:]))
+    renderers = [renderer for renderer, _ in targets]
+    # fragments[i] maps a renderer name to the fragment for pair i
+    fragments = [{} for _ in pairs]
+    if cache_dir is not None:
+        with timings.phase('cache lookup'):
+            only = "-only" if ONLY_CHANGES_WITH_STEP else ""
+            caches = {renderer.name: FragmentCache(cache_dir, renderer.name + only)
+                      for renderer in renderers}
+            digests = {}
+            keys = [
+                {renderer.name: FragmentCache.key(a, b, renderer, engine, digests)
+                 for renderer in renderers}
+                for a, b in pairs
+            ]
+            for i, pair_keys in enumerate(keys):
+                for name, key in pair_keys.items():
+                    if (fragment := caches[name].get(key)) is not None:
+                        fragments[i][name] = fragment
+    # for each pair to render, the renderers that are needed
+    todo = {
+        i: missing for i in range(len(pairs))
+        if (missing := [r for r in renderers if r.name not in fragments[i]])
+    }
+    info(f"rendering {len(todo)} out of {len(pairs)} pairs")
+
+    def collect(results):
+        for i, (a, b) in enumerate(pairs):
+            if i in todo:
+                info(f"==== comparing {a.name} and {b.name}")
+                rendered = results[i]()
+                # a is not needed any longer
+                a.release()
+                fragments[i].update(rendered)
+                if cache_dir is not None:
+                    for name, fragment in rendered.items():
+                        caches[name].put(keys[i][name], fragment)
+            for renderer, out in targets:
+                out.write(timings.written(fragments[i][renderer.name]))
+
+    if jobs <= 1:
+        with timings.phase('render'):
+            collect({
+                i: (lambda a=pairs[i][0], b=pairs[i][1], missing=missing:
+                    render_pair(a, b, missing, ONLY_CHANGES_WITH_STEP, engine))
+                for i, missing in todo.items()
+            })
+    else:
+        level = logging.getLogger().level
+        with (timings.phase('render'),
+              ProcessPoolExecutor(max_workers=jobs,
+                                  initializer=init_worker,
+                                  initargs=(level,)) as executor):
+
+            def submit(i, missing):
+                args = (*pairs[i], missing, ONLY_CHANGES_WITH_STEP, engine)
+                if not timings.ENABLED:
+                    return executor.submit(render_pair, *args).result
+                # bring back the timings recorded in the worker
+                future = executor.submit(timings.collected, render_pair, *args)
+                return lambda: timings.merged(*future.result())
+
+            collect({i: submit(i, missing) for i, missing in todo.items()})
+    if cache_dir is not None:
+        for name, cache in caches.items():
+            cache.evict(pair_keys[name] for pair_keys in keys)
 
 # using click to expose one command per function
 
 @click.group(chain=True, help=sys.modules[__name__].__doc__)
 @click.option("--debug", is_flag=True, help="enable debug output")
 @click.option("--quiet", is_flag=True, help="enable debug output")
-def cli(debug, quiet):
+@click.option("--timings", 'with_timings', is_flag=True, help="print on stderr where the time goes")
+@click.option("--timings-trace", type=Path, default=None, help="also save the detailed timings in this JSON file")
+def cli(debug, quiet, with_timings, timings_trace):
     if debug:
         logging.getLogger().setLevel(logging.DEBUG)
     if quiet:
         logging.getLogger().setLevel(logging.WARNING)
+    if with_timings or timings_trace:
+        timings.enable(timings_trace)
 
 
 @cli.command('diff-files', help="write out diff between two files")
 @click.option('-f', '--filename', type=str, help='Filename for the output')
 @click.option('-l', '--lang', type=str, default='python', help='Language for syntax highlighting')
 @click.option('-c', '--comment', type=str, default=None, help='Comment character for the language')
+@click.option('-e', '--diff-engine', type=click.Choice(list(DIFF_ENGINES)), default='difflib', help="the algorithm used to compute the diffs")
 @click.argument('file1', type=Path)
 @click.argument('file2', type=Path)
-def onefile_cli(filename, lang, comment, file1, file2):
+def onefile_cli(filename, lang, comment, diff_engine, file1, file2):
     onefile_diff(
         file1, file2, filename=filename, lang=lang, comment=comment,
+        engine=diff_engine,
     )
 
 
 @cli.command('diff-dirs', help="write out diff between two directories")
+@click.option('-s', '--scrolly', is_flag=True, help='Use scrolly mode')
+@click.option('-a', '--all-files', is_flag=True, help="consider all files, not just the ones under git")
+@click.option('-e', '--diff-engine', type=click.Choice(list(DIFF_ENGINES)), default='difflib', help="the algorithm used to compute the diffs")
 @click.argument('dir1', type=Path)
 @click.argument('dir2', type=Path)
-def onedir_cli(dir1, dir2):
-    onedir_diff(dir1, dir2)
+def onedir_cli(scrolly, all_files, diff_engine, dir1, dir2):
+    onedir_diff(dir1, dir2, only_git=not all_files,
+                renderer=RENDERERS['scrolly' if scrolly else 'single'],
+                engine=diff_engine)
+
+
+# the output files are written with large buffers
+OUTPUT_BUFFERING = 1 << 20
+
+
+class ShardWriter:
+    """
+    a target for chaindirs, that gets one write() per step pair, in order,
+    and spreads the fragments in one mdx file per group of shard_size steps
+
+    on close, it writes index.json, that describes each shard with
+    its file name, its steps, and the topic, label and tooltip for its
+    TableOfContentsItem - see fillauto.py
+    the files are rewritten only if their content has changed,
+    and the shards that are no longer relevant are removed
+    """
+
+    def __init__(self, folder, trees, shard_size=1):
+        self.folder = Path(folder)
+        # the tree for the second step in each pair
+        self.trees = trees[1:]
+        self.shard_size = shard_size
+        self.fragments = []
+
+    def write(self, fragment):
+        self.fragments.append(fragment)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        # after a failure, only part of the fragments are there; writing them
+        # would truncate the index, and remove the other shards as stale
+        if exc_type is None:
+            self.close()
+
+    def close(self):
+        self.folder.mkdir(parents=True, exist_ok=True)
+        # the steps that have something to show
+        steps = [(tree, fragment) for tree, fragment in zip(self.trees, self.fragments)
+                 if fragment]
+        index = []
+        for start in range(0, len(steps), self.shard_size):
+            group = steps[start:start + self.shard_size]
+            names = [tree.name for tree, _ in group]
+            readmes = [step_readme(tree) for tree, _ in group]
+            file = f"shard-{names[0]}.mdx"
+            if len(group) == 1:
+                topic, label = f"step {names[0]} {readmes[0]}", f"{names[0]} {readmes[0]}"
+            else:
+                topic, label = f"steps {names[0]} to {names[-1]}", f"{names[0]}-{names[-1]}"
+            index.append({'file': file, 'steps': names, 'topic': topic,
+                          'label': label, 'tooltip': " / ".join(readmes)})
+            if fillauto.write_if_changed(
+                    self.folder / file, "".join(fragment for _, fragment in group)):
+                debug(f"shard {file} written")
+        files = {shard['file'] for shard in index}
+        for stale in self.folder.glob("shard-*.mdx"):
+            if stale.name not in files:
+                debug(f"removing stale shard {stale.name}")
+                stale.unlink()
+        fillauto.write_if_changed(self.folder / fillauto.SHARDS_INDEX,
+                                  json.dumps(index, indent=2) + "\n")
+        info(f"{len(index)} shards written in {self.folder}")
+
+
+def write_chain(trees, scrolly, jobs, cache_dir, output, out_single, out_scrolly,
+                shards=None, shard_size=1, engine='difflib'):
+    """
+    the output part, common to chain-dirs and chain-git
+    """
+    if jobs == 0:
+        jobs = os.cpu_count()
+    # with neither --out-single nor --out-scrolly nor --shards, write on output or stdout
+    outputs = {'single': out_single, 'scrolly': out_scrolly}
+    outputs = {name: output for name, output in outputs.items() if output is not None}
+    if not outputs and shards is None:
+        renderer = RENDERERS['scrolly' if scrolly else 'single']
+        if output is None:
+            chaindirs(trees, [(renderer, sys.stdout)], jobs=jobs, cache_dir=cache_dir,
+                      engine=engine)
+            return
+        outputs = {renderer.name: output}
+    with ExitStack() as stack:
+        targets = [
+            (RENDERERS[name],
+             stack.enter_context(output.open('w', buffering=OUTPUT_BUFFERING)))
+            for name, output in outputs.items()
+        ]
+        if shards is not None:
+            targets.append((RENDERERS['shard'],
+                            stack.enter_context(ShardWriter(shards, trees, shard_size))))
+        chaindirs(trees, targets, jobs=jobs, cache_dir=cache_dir, engine=engine)
+    for name, output in outputs.items():
+        info(f"{name} output written in {output}")
 
 
 @cli.command('chain-dirs', help="write out diff between a succession of directories")
-@click.option('-s', '--scrolly', is_flag=True, help='Use scrolly mode')
+@click.option('-s', '--scrolly', is_flag=True, help='Use scrolly mode - when writing on stdout or --output')
 @click.option('-a', '--all-files', is_flag=True, help="consider all files, not just the ones under git")
-@click.option('-o', '--only-changes-with-step', is_flag=True, help="only show changes with a step.md file")
+@click.option('--only-changes-with-step', is_flag=True, help="only show changes with a step.md file")
+@click.option('-j', '--jobs', type=int, default=1, help="number of worker processes - 0 means one per cpu")
+@click.option('-c', '--cache-dir', type=Path, default=None, help="keep the rendered fragments in this folder, and render only the pairs that have changed")
+@click.option('-o', '--output', type=Path, default=None, help="write the output in this file rather than on stdout")
+@click.option('--out-single', type=Path, default=None, help="write the single column output in this file")
+@click.option('--out-scrolly', type=Path, default=None, help="write the scrollycoding output in this file")
+@click.option('--shards', type=Path, default=None, help="write the sharded output - one mdx file per group of steps, and an index - in this folder")
+@click.option('--shard-size', type=int, default=1, help="number of steps per shard")
+@click.option('-e', '--diff-engine', type=click.Choice(list(DIFF_ENGINES)), default='difflib', help="the algorithm used to compute the diffs")
 @click.argument('dirs', type=Path, nargs=-1)
-def chaindirs_cli(scrolly, all_files, only_changes_with_step, dirs):
+def chaindirs_cli(scrolly, all_files, only_changes_with_step, jobs, cache_dir,
+                  output, out_single, out_scrolly, shards, shard_size, diff_engine, dirs):
     if len(dirs) < 2:
         error("At least two directories are required for comparison.")
         return
-    global SCROLLY
-    SCROLLY = scrolly
     global ONLY_CHANGES_WITH_STEP
     ONLY_CHANGES_WITH_STEP = only_changes_with_step
 
-    chaindirs(dirs, only_git=not all_files)
+    trees = [FolderTree(path, only_git=not all_files) for path in dirs]
+    write_chain(trees, scrolly, jobs, cache_dir, output, out_single, out_scrolly,
+                shards, shard_size, diff_engine)
+
+
+@cli.command('chain-git', help="write out diff between the steps in a git repo, without going through folders")
+@click.option('-b', '--branch', type=str, default="HEAD", help="the branch to scan")
+@click.option('-s', '--scrolly', is_flag=True, help='Use scrolly mode - when writing on stdout or --output')
+@click.option('--only-changes-with-step', is_flag=True, help="only show changes with a step.md file")
+@click.option('-j', '--jobs', type=int, default=1, help="number of worker processes - 0 means one per cpu")
+@click.option('-c', '--cache-dir', type=Path, default=None, help="keep the rendered fragments in this folder, and render only the pairs that have changed")
+@click.option('-o', '--output', type=Path, default=None, help="write the output in this file rather than on stdout")
+@click.option('--out-single', type=Path, default=None, help="write the single column output in this file")
+@click.option('--out-scrolly', type=Path, default=None, help="write the scrollycoding output in this file")
+@click.option('--shards', type=Path, default=None, help="write the sharded output - one mdx file per group of steps, and an index - in this folder")
+@click.option('--shard-size', type=int, default=1, help="number of steps per shard")
+@click.option('-e', '--diff-engine', type=click.Choice(list(DIFF_ENGINES)), default='difflib', help="the algorithm used to compute the diffs")
+@click.argument('repo', type=Path)
+def chaingit_cli(branch, scrolly, only_changes_with_step, jobs, cache_dir,
+                 output, out_single, out_scrolly, shards, shard_size, diff_engine, repo):
+    """
+    the output is the same as chain-dirs --all-files on the output of steps.py tofolders
+    """
+    trees = git_trees(repo, branch)
+    if len(trees) < 2:
+        error("At least two steps are required for comparison.")
+        return
+    global ONLY_CHANGES_WITH_STEP
+    ONLY_CHANGES_WITH_STEP = only_changes_with_step
+
+    write_chain(trees, scrolly, jobs, cache_dir, output, out_single, out_scrolly,
+                shards, shard_size, diff_engine)
+
+
+def folder_signature(path):
+    """
+    a cheap fingerprint of the contents of a folder, from the sizes and mtimes
+    """
+    return tuple(sorted(
+        (file, stat.st_size, stat.st_mtime_ns) for file, stat in scan_folder(path).items()))
+
+
+def target_signature(folder):
+    """
+    the fingerprint of what fillauto reads in a target folder: AUTO and the templates
+    """
+    signature = []
+    for file in [folder / 'AUTO', *sorted(folder.glob('*.j2'))]:
+        if file.exists():
+            stat = file.stat()
+            signature.append((file.name, stat.st_size, stat.st_mtime_ns))
+    return tuple(signature)
+
+
+def watch(steps_folder, outputs, only_git, interval=1., rounds=None, engine='difflib'):
+    """
+    polls the step folders, and the folders where the outputs are
+
+    outputs is a dict renderer name -> AUTO file; when a step folder changes,
+    only the pairs that involve it get rendered again, and an AUTO file
+    is rewritten only if its content has changed; fillauto then runs only
+    in the target folders where AUTO or a template has changed
+
+    with rounds set, stop after that many polls - mostly for testing
+    """
+    renderers = [RENDERERS[name] for name in outputs]
+    # (name1, signature1, name2, signature2) -> {renderer name: fragment}
+    fragments = {}
+    signatures = {}
+    targets = {}
+    polls = 0
+
+    def poll_steps():
+        nonlocal fragments, signatures
+        folders = sorted(path for path in steps_folder.glob("[0-9]*") if path.is_dir())
+        current = {folder.name: folder_signature(folder) for folder in folders}
+        if current == signatures:
+            return
+        rendered = {}
+        try:
+            for folder1, folder2 in zip(folders, folders[1:]):
+                key = (folder1.name, current[folder1.name], folder2.name, current[folder2.name])
+                if key not in fragments:
+                    info(f"==== comparing {folder1.name} and {folder2.name}")
+                    fragments[key] = render_pair(
+                        FolderTree(folder1, only_git), FolderTree(folder2, only_git),
+                        renderers, ONLY_CHANGES_WITH_STEP, engine)
+                rendered[key] = fragments[key]
+        finally:
+            # the trees are built again at each round, so there is
+            # no point in keeping the hashes of the files they had
+            INODE_HASHES.clear()
+        # forget about the pairs that are gone
+        fragments = rendered
+        for name, output in outputs.items():
+            text = "".join(fragment[name] for fragment in fragments.values())
+            if fillauto.write_if_changed(output, text):
+                info(f"{name} output written in {output}")
+        signatures = current
+
+    def poll_targets():
+        for folder in {output.parent for output in outputs.values()}:
+            signature = target_signature(folder)
+            if targets.get(folder) != signature:
+                fillauto.handle_folder(folder)
+                targets[folder] = signature
+
+    while rounds is None or polls < rounds:
+        if polls:
+            time.sleep(interval)
+        polls += 1
+        # the steps folder may be regenerated under our feet, e.g. by tofolders;
+        # in that case keep the previous signatures, and retry at the next poll
+        try:
+            poll_steps()
+            poll_targets()
+        except OSError as exc:
+            warning(f"{exc} - retrying at the next poll")
+
+
+@cli.command('watch', help="keep the AUTO files, and the outputs of their templates, up to date while editing the steps")
+@click.option('-a', '--all-files', is_flag=True, help="consider all files, not just the ones under git")
+@click.option('--only-changes-with-step', is_flag=True, help="only show changes with a step.md file")
+@click.option('-i', '--interval', type=float, default=1., help="number of seconds between two polls")
+@click.option('--out-single', type=Path, default=None, help="the AUTO file for the single column output")
+@click.option('--out-scrolly', type=Path, default=None, help="the AUTO file for the scrollycoding output")
+@click.option('-e', '--diff-engine', type=click.Choice(list(DIFF_ENGINES)), default='difflib', help="the algorithm used to compute the diffs")
+@click.argument('steps_folder', type=Path)
+def watch_cli(all_files, only_changes_with_step, interval, out_single, out_scrolly,
+              diff_engine, steps_folder):
+    """
+    the step folders are the [0-9]* subfolders of steps_folder, so that
+    adding or removing a step is taken into account as well
+    """
+    outputs = {'single': out_single, 'scrolly': out_scrolly}
+    outputs = {name: output for name, output in outputs.items() if output is not None}
+    if not outputs:
+        error("at least one of --out-single and --out-scrolly is required")
+        return
+    global ONLY_CHANGES_WITH_STEP
+    ONLY_CHANGES_WITH_STEP = only_changes_with_step
+    info(f"watching {steps_folder} - hit Control-C to stop")
+    try:
+        watch(steps_folder, outputs, only_git=not all_files, interval=interval,
+              engine=diff_engine)
+    except KeyboardInterrupt:
+        pass
 
 
 if __name__ == "__main__":
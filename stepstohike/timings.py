@@ -0,0 +1,173 @@
+"""
+an optional instrumentation, shared by steps.py and stepstohike.py
+and enabled with their --timings option
+
+it records
+- the wall time of each phase, and of each step pair
+- the number of subprocesses, and the time spent waiting for them
+- the bytes read and written
+- the time spent diffing each file
+
+and prints a summary table on stderr when the process exits,
+and optionally saves all the events in a JSON trace file
+
+when not enabled - the default - all the hooks are cheap no-ops
+"""
+
+import sys
+import time
+import json
+import atexit
+import subprocess as sp
+from pathlib import Path
+from contextlib import contextmanager
+from collections import defaultdict
+
+ENABLED = False
+# the recorded events, as (kind, name, seconds) tuples
+EVENTS = []
+# the bytes read and written
+COUNTERS = defaultdict(int)
+START = time.perf_counter()
+
+
+def enable(trace: Path | None = None):
+    global ENABLED, START
+    if ENABLED:
+        return
+    ENABLED = True
+    START = time.perf_counter()
+    atexit.register(report, trace)
+
+
+@contextmanager
+def timed(kind, name):
+    """
+    record the time spent in the block as an event of that kind
+    """
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        EVENTS.append((kind, name, time.perf_counter() - start))
+
+
+def phase(name):
+    return timed('phase', name)
+
+
+def describe(command) -> str:
+    """
+    a short name for a command, e.g. 'git ls-files'
+    """
+    words = command.split() if isinstance(command, str) else [str(word) for word in command]
+    if words[:1] != ['git']:
+        return words[0]
+    # skip git -C <dir>
+    if words[:2] == ['git', '-C']:
+        words = words[:1] + words[3:]
+    return " ".join(words[:2])
+
+
+def run(*args, **kwds) -> sp.CompletedProcess:
+    """
+    a drop-in replacement for subprocess.run, that gets accounted for
+    """
+    if not ENABLED:
+        return sp.run(*args, **kwds)
+    with timed('subprocess', describe(args[0] if args else kwds['args'])):
+        return sp.run(*args, **kwds)
+
+
+def popen(*args, **kwds) -> sp.Popen:
+    """
+    a drop-in replacement for subprocess.Popen; these are long-lived
+    processes, that are counted but whose time is accounted for by the caller
+    """
+    if ENABLED:
+        EVENTS.append(('subprocess', describe(args[0] if args else kwds['args']), 0.))
+    return sp.Popen(*args, **kwds)
+
+
+def read(data):
+    """
+    account for data that was read, and return it
+    """
+    if ENABLED:
+        COUNTERS['bytes read'] += len(data)
+    return data
+
+
+def written(data):
+    """
+    account for data about to be written, and return it
+    strings are counted in characters, which is close enough
+    """
+    if ENABLED:
+        COUNTERS['bytes written'] += len(data)
+    return data
+
+
+def collected(function, *args):
+    """
+    run function in a worker process, and return its result together with
+    the timings recorded in the worker, so they can be merged in the parent
+    """
+    # with the spawn or forkserver start methods, the worker
+    # does not inherit the setting from the parent
+    global ENABLED
+    ENABLED = True
+    EVENTS.clear()
+    COUNTERS.clear()
+    result = function(*args)
+    return result, list(EVENTS), dict(COUNTERS)
+
+
+def merged(result, events, counters):
+    """
+    the counterpart of collected, in the parent process; returns result
+    """
+    EVENTS.extend(events)
+    for key, value in counters.items():
+        COUNTERS[key] += value
+    return result
+
+
+# the kinds in the summary, and how many of the slowest names to show
+KINDS = [('phase', None), ('subprocess', None), ('pair', 5), ('diff', 5)]
+
+
+def summary() -> str:
+    lines = [f"===== timings - {time.perf_counter() - START:.3f}s in total"]
+    for kind, top in KINDS:
+        by_name = defaultdict(list)
+        for event_kind, name, seconds in EVENTS:
+            if event_kind == kind:
+                by_name[name].append(seconds)
+        if not by_name:
+            continue
+        total = sum(sum(durations) for durations in by_name.values())
+        count = sum(len(durations) for durations in by_name.values())
+        lines.append(f"{kind:>10}: {count} for {total:.3f}s")
+        rows = sorted(by_name.items(), key=lambda item: -sum(item[1]))
+        if top is not None:
+            rows = rows[:top]
+        for name, durations in rows:
+            lines.append(f"{'':>10}  {sum(durations):8.3f}s {len(durations):6d}x"
+                         f" max {max(durations):7.3f}s  {name}")
+    for key, value in COUNTERS.items():
+        lines.append(f"{key:>15}: {value / 2**20:.2f} MB")
+    return "\n".join(lines) + "\n"
+
+
+def report(trace=None):
+    sys.stderr.write(summary())
+    if trace is not None:
+        trace.write_text(json.dumps(
+            {'events': [dict(kind=kind, name=name, seconds=seconds)
+                        for kind, name, seconds in EVENTS],
+             'counters': COUNTERS}, indent=2) + "\n")
+        sys.stderr.write(f"timings trace saved in {trace}\n")